@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+    stego_lsb.ArraySteg
+    ~~~~~~~~~~~~~~~~~~~
+
+    This module contains functions for hiding and recovering
+    data directly in NumPy integer arrays, such as image and
+    video frame stacks that are already in memory.
+
+    Payloads use the same layout as :mod:`stego_lsb.LSBSteg`, so a
+    (height, width, channels) uint8 array is interchangeable with
+    the corresponding image.
+
+    :copyright: (c) 2015 by Ryan Gibson, see AUTHORS.md for more details.
+    :license: MIT License, see LICENSE.md for more details.
+"""
+import logging
+import sys
+from itertools import chain
+from typing import Any, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from stego_lsb.bit_manipulation import lsb_deinterleave_array, lsb_interleave_array, roundup
+from stego_lsb.instrumentation import span
+
+log = logging.getLogger(__name__)
+
+Axes = Optional[Sequence[int]]
+
+
+def bytes_in_max_file_size(num_values: int, num_lsb: int) -> int:
+    """Returns the number of bytes needed to store the size of a payload hidden in num_values values."""
+    return roundup((num_values * num_lsb).bit_length() / 8)
+
+
+def _tagged_payload(message: bytes, num_values: int, num_lsb: int, skip_storage_check: bool) -> bytes:
+    # We add the size of the message to the beginning of the payload, as LSBSteg does.
+    data = len(message).to_bytes(bytes_in_max_file_size(num_values, num_lsb), byteorder=sys.byteorder) + message
+    if 8 * len(data) > num_values * num_lsb and not skip_storage_check:
+        raise ValueError(f"Only able to hide {num_values * num_lsb // 8} bytes in these values with {num_lsb} LSBs, "
+                         f"but {len(data)} bytes were requested")
+    return data
+
+
+def _hide_bits(array: npt.NDArray[Any], data: bytes, bit_offset: int, num_lsb: int,
+               axes: Axes) -> Tuple[npt.NDArray[Any], int]:
+    """Hides data, starting bit_offset bits in, in array traversed in C order after transposing to axes.
+
+    The array is modified in place if it is writable. Returns the modified array and the number of bits hidden."""
+    if not array.flags.writeable:
+        array = array.copy()
+    traversal = array if axes is None else np.transpose(array, axes)
+
+    # reshape returns a strided view when the values are evenly spaced in memory (e.g. one channel of a frame
+    # stack), which the kernels can't use, so we hide in a contiguous copy and write it back instead
+    flattened = traversal.reshape(-1)
+    if not flattened.flags.c_contiguous:
+        flattened = np.ascontiguousarray(flattened)
+    num_bits = lsb_interleave_array(flattened, data, num_lsb, bit_offset=bit_offset)
+    if not np.may_share_memory(flattened, array):
+        traversal[...] = flattened.reshape(traversal.shape)
+    return array, num_bits
+
+
+def _recover_bits(array: npt.NDArray[Any], num_bits: int, num_lsb: int, axes: Axes) -> npt.NDArray[np.uint8]:
+    traversal = array if axes is None else np.transpose(array, axes)
+    return lsb_deinterleave_array(np.ascontiguousarray(traversal).reshape(-1), num_bits, num_lsb)
+
+
+def max_bits_to_hide(array: npt.NDArray[Any], num_lsb: int) -> int:
+    """Returns the number of bits we're able to hide in the array using num_lsb least significant bits."""
+    return int(array.size * num_lsb)
+
+
+def hide_message_in_array(array: npt.NDArray[Any], message: Union[str, bytes], num_lsb: int, axes: Axes = None,
+                          skip_storage_check: bool = False) -> npt.NDArray[Any]:
+    """Hides the message in an integer array of any shape and returns the modified array.
+
+    Values are visited in C order after transposing the array to axes, e.g. axes=(3, 0, 1, 2)
+    fills one channel of every frame of a (frames, height, width, channels) stack before
+    moving on to the next. Writable arrays are modified in place."""
+    message = message.encode() if isinstance(message, str) else bytes(message)
+    data = _tagged_payload(message, array.size, num_lsb, skip_storage_check)
+
+    with span("interleave", len(data)):
+        array, _ = _hide_bits(array, data, 0, num_lsb, axes)
+    return array
+
+
+def recover_message_from_array(array: npt.NDArray[Any], num_lsb: int, axes: Axes = None) -> bytes:
+    """Returns the message hidden in the array by hide_message_in_array."""
+    file_size_tag_size = bytes_in_max_file_size(array.size, num_lsb)
+    tag_bits = _recover_bits(array, 8 * file_size_tag_size, num_lsb, axes)
+    bytes_to_recover = int.from_bytes(np.packbits(tag_bits).tobytes(), byteorder=sys.byteorder)
+
+    maximum_bytes_in_array = max_bits_to_hide(array, num_lsb) // 8 - file_size_tag_size
+    if bytes_to_recover > maximum_bytes_in_array:
+        raise ValueError(f"This array appears to be corrupted.\nIt claims to hold {bytes_to_recover} B, "
+                         f"but can only hold {maximum_bytes_in_array} B with {num_lsb} LSBs")
+
+    with span("deinterleave", bytes_to_recover):
+        bits = _recover_bits(array, 8 * (file_size_tag_size + bytes_to_recover), num_lsb, axes)
+    return np.packbits(bits).tobytes()[file_size_tag_size:]
+
+
+def hide_message_in_frames(frames: Iterable[npt.NDArray[Any]], message: Union[str, bytes], num_lsb: int,
+                           num_frames: int, axes: Axes = None,
+                           skip_storage_check: bool = False) -> Iterator[npt.NDArray[Any]]:
+    """Hides the message across a stream of same-shaped frames, yielding each frame once it has been modified.
+
+    Only one frame needs to be in memory at a time. num_frames is the total length of the
+    stream, which determines the size tag, so the result is identical to calling
+    hide_message_in_array on the stacked frames with axes shifted by one (the frame axis
+    always comes first). Frames after the payload are yielded unchanged.
+
+    A ValueError is raised if a frame's shape differs from the first one, or if the
+    stream ends before the whole message has been hidden."""
+    message = message.encode() if isinstance(message, str) else bytes(message)
+    frame_iterator = iter(frames)
+    first_frame = next(frame_iterator, None)
+    if first_frame is None:
+        raise ValueError("Hiding in frames requires at least one frame")
+    data = _tagged_payload(message, num_frames * first_frame.size, num_lsb, skip_storage_check)
+
+    bit_offset = 0
+    for frame in chain([first_frame], frame_iterator):
+        if frame.shape != first_frame.shape:
+            raise ValueError(f"Every frame must have the shape {first_frame.shape}, not {frame.shape}")
+        if bit_offset < 8 * len(data):
+            frame, num_bits = _hide_bits(frame, data, bit_offset, num_lsb, axes)
+            bit_offset += num_bits
+        yield frame
+
+    if bit_offset < 8 * len(data):
+        raise ValueError(f"The frames ended after hiding {bit_offset // 8} of {len(data)} bytes")
+
+
+def recover_message_from_frames(frames: Iterable[npt.NDArray[Any]], num_lsb: int, num_frames: int,
+                                axes: Axes = None) -> bytes:
+    """Returns the message hidden by hide_message_in_frames, consuming only as many frames as needed.
+
+    The bits recovered from each frame are packed into bytes as they arrive, so memory usage
+    is about one byte per byte of the message in addition to a single frame."""
+    recovered = bytearray()
+    leftover_bits = np.zeros(0, dtype=np.uint8)  # fewer than 8 bits that don't fill a byte yet
+    num_recovered = 0
+    bits_to_recover: Optional[int] = None
+    file_size_tag_size = 0
+
+    for frame in frames:
+        if bits_to_recover is None:
+            file_size_tag_size = bytes_in_max_file_size(num_frames * frame.size, num_lsb)
+
+        # until the size tag is known, we don't know how much of the frame holds the message
+        remaining = max_bits_to_hide(frame, num_lsb) if bits_to_recover is None else bits_to_recover - num_recovered
+        bits = _recover_bits(frame, remaining, num_lsb, axes)
+        num_recovered += bits.size
+        if leftover_bits.size:
+            bits = np.concatenate([leftover_bits, bits])
+        num_whole_bits = bits.size - bits.size % 8
+        recovered += np.packbits(bits[:num_whole_bits]).tobytes()
+        leftover_bits = bits[num_whole_bits:].copy()
+
+        if bits_to_recover is None and len(recovered) >= file_size_tag_size:
+            bytes_to_recover = int.from_bytes(recovered[:file_size_tag_size], byteorder=sys.byteorder)
+            maximum_bytes_in_frames = num_frames * max_bits_to_hide(frame, num_lsb) // 8 - file_size_tag_size
+            if bytes_to_recover > maximum_bytes_in_frames:
+                raise ValueError(f"These frames appear to be corrupted.\nThey claim to hold {bytes_to_recover} B, "
+                                 f"but can only hold {maximum_bytes_in_frames} B with {num_lsb} LSBs")
+            bits_to_recover = 8 * (file_size_tag_size + bytes_to_recover)
+
+        if bits_to_recover is not None and num_recovered >= bits_to_recover:
+            break
+
+    if bits_to_recover is None or num_recovered < bits_to_recover:
+        raise ValueError("The frames ended before the hidden message was fully recovered")
+    # the frame holding the size tag may have been recovered beyond the end of the message
+    del recovered[bits_to_recover // 8:]
+    del recovered[:file_size_tag_size]
+    return bytes(recovered)
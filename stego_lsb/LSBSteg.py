@@ -10,21 +10,33 @@
     :license: MIT License, see LICENSE.md for more details.
 """
 import logging
+import math
 import os
 import sys
-from time import time
-from typing import Tuple, IO, Union, List, cast
+from typing import Any, Tuple, IO, Union, List, Optional, cast
 
+import numpy as np
+import numpy.typing as npt
 from PIL import Image
 
+from stego_lsb import ArraySteg
 from stego_lsb.bit_manipulation import (
+    lsb_deinterleave_array,
     lsb_deinterleave_list,
+    lsb_deinterleave_variable,
+    lsb_interleave_array,
     lsb_interleave_list,
+    lsb_interleave_variable,
     roundup,
 )
+from stego_lsb.instrumentation import span
+from stego_lsb.png_stream import PngStripReader, PngStripWriter, decode_rows
 
 log = logging.getLogger(__name__)
 
+# detect_num_lsb warns when its best guess is less likely than this
+DETECTION_CONFIDENCE = 0.99
+
 
 def _str_to_bytes(x: Union[bytes, str], charset: str = sys.getdefaultencoding(), errors: str = "strict") -> bytes:
     if x is None:
@@ -73,35 +85,36 @@ def bytes_in_max_file_size(image: Image.Image, num_lsb: int, num_channels: int)
 def hide_message_in_image(input_image: Image.Image, message: Union[str, bytes], num_lsb: int,
                           skip_storage_check: bool = False) -> Image.Image:
     """Hides the message in the input image and returns the modified image object."""
-    start = time()
     num_channels = len(input_image.getbands())
-    flattened_color_data = [v for t in input_image.getdata() for v in t]
+    with span("flatten") as s:
+        flattened_color_data = [v for t in input_image.getdata() for v in t]
+        s.num_bytes = len(flattened_color_data)
 
     # We add the size of the input file to the beginning of the payload.
     message_size = len(message)
     file_size_tag = message_size.to_bytes(bytes_in_max_file_size(input_image, num_lsb, num_channels),
                                           byteorder=sys.byteorder)
     data = file_size_tag + _str_to_bytes(message)
-    log.debug(f"{'Files read':<30} in {time() - start:.2f}s")
 
     if 8 * len(data) > max_bits_to_hide(input_image, num_lsb, num_channels) and not skip_storage_check:
         raise ValueError(f"Only able to hide {max_bits_to_hide(input_image, num_lsb, num_channels) // 8} bytes in "
                          f"this image with {num_lsb} LSBs, but {len(data)} bytes were requested")
 
-    start = time()
-    flattened_color_data = lsb_interleave_list(flattened_color_data, data, num_lsb)
-    log.debug(f"{f'{message_size} bytes hidden':<30} in {time() - start:.2f}s")
+    with span("interleave", len(data)):
+        flattened_color_data = lsb_interleave_list(flattened_color_data, data, num_lsb)
 
-    start = time()
-    # PIL expects a sequence of tuples, one per pixel
-    input_image.putdata(cast(List[int], list(zip(*[iter(flattened_color_data)] * num_channels))))
-    log.debug(f"{'Image overwritten':<30} in {time() - start:.2f}s")
+    with span("rebuild", len(flattened_color_data)):
+        # PIL expects a sequence of tuples, one per pixel
+        input_image.putdata(cast(List[int], list(zip(*[iter(flattened_color_data)] * num_channels))))
     return input_image
 
 
 def hide_data(input_image_path: str, input_file_path: str, steg_image_path: str, num_lsb: int,
-              compression_level: int, skip_storage_check: bool = False) -> None:
-    """Hides the data from the input file in the input image."""
+              compression_level: int, skip_storage_check: bool = False, min_lsb: Optional[int] = None) -> None:
+    """Hides the data from the input file in the input image.
+
+    If min_lsb is given, the data is hidden adaptively using between min_lsb and num_lsb LSBs
+    per color value, see hide_message_in_image_adaptive."""
     if input_image_path is None:
         raise ValueError("LSBSteg hiding requires an input image file path")
     if input_file_path is None:
@@ -111,18 +124,31 @@ def hide_data(input_image_path: str, input_file_path: str, steg_image_path: str,
 
     image, input_file = prepare_hide(input_image_path, input_file_path)
     with image as image, input_file as input_file:
-        image = hide_message_in_image(image, input_file.read(), num_lsb, skip_storage_check=skip_storage_check)
+        with span("decode") as s:
+            image.load()
+            s.num_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        with span("read") as s:
+            message = input_file.read()
+            s.num_bytes = len(message)
+
+        if min_lsb is not None:
+            image = hide_message_in_image_adaptive(image, message, min_lsb, num_lsb,
+                                                   skip_storage_check=skip_storage_check)
+        else:
+            image = hide_message_in_image(image, message, num_lsb, skip_storage_check=skip_storage_check)
 
-        # just in case is_animated is not defined, as suggested by the Pillow documentation
-        is_animated = getattr(image, "is_animated", False)
-        image.save(steg_image_path, compress_level=compression_level, save_all=is_animated)
+        with span("encode", image.size[0] * image.size[1] * len(image.getbands())):
+            # just in case is_animated is not defined, as suggested by the Pillow documentation
+            is_animated = getattr(image, "is_animated", False)
+            image.save(steg_image_path, compress_level=compression_level, save_all=is_animated)
 
 
 def recover_message_from_image(input_image: Image.Image, num_lsb: int) -> bytes:
     """Returns the message from the steganographed image"""
-    start = time()
     num_channels = len(input_image.getbands())
-    color_data = [v for t in input_image.getdata() for v in t]
+    with span("flatten") as s:
+        color_data = [v for t in input_image.getdata() for v in t]
+        s.num_bytes = len(color_data)
 
     file_size_tag_size = bytes_in_max_file_size(input_image, num_lsb, num_channels)
     tag_bit_height = roundup(8 * file_size_tag_size / num_lsb)
@@ -135,28 +161,334 @@ def recover_message_from_image(input_image: Image.Image, num_lsb: int) -> bytes:
         raise ValueError(f"This image appears to be corrupted.\nIt claims to hold {bytes_to_recover} B, "
                          f"but can only hold {maximum_bytes_in_image} B with {num_lsb} LSBs")
 
-    log.debug(f"{'Files read':<30} in {time() - start:.2f}s")
-
-    start = time()
-    data = lsb_deinterleave_list(color_data, 8 * (bytes_to_recover + file_size_tag_size), num_lsb)[
-           file_size_tag_size:]
-    log.debug(f"{f'{bytes_to_recover} bytes recovered':<30} in {time() - start:.2f}s")
+    with span("deinterleave", bytes_to_recover):
+        data = lsb_deinterleave_list(color_data, 8 * (bytes_to_recover + file_size_tag_size), num_lsb)[
+               file_size_tag_size:]
     return data
 
 
-def recover_data(steg_image_path: str, output_file_path: str, num_lsb: int) -> None:
-    """Writes the data from the steganographed image to the output file"""
+def detect_num_lsb(input_image: Image.Image) -> int:
+    """Returns the number of LSBs most likely used to hide data in the steganographed image
+
+    Only the file size tags are decoded, for every number of LSBs at once from the bits of the
+    first few color values. Candidates whose tag claims more data than the image can hold are
+    rejected. A tag read with the wrong number of LSBs is effectively random, while genuine
+    message sizes are spread over orders of magnitude (a size between 1 and 10 KB is about as
+    likely as one between 10 and 100 KB), so the rest are weighed by how much more likely their
+    tag is to be a genuine size than random bits. A warning is logged when the winner is less
+    than DETECTION_CONFIDENCE likely, since the recovered data may then be garbage."""
+    num_channels = len(input_image.getbands())
+    width, height = input_image.size
+    num_values = num_channels * width * height
+
+    tag_sizes = {num_lsb: bytes_in_max_file_size(input_image, num_lsb, num_channels) for num_lsb in range(1, 9)}
+    tag_bit_heights = {num_lsb: roundup(8 * tag_size / num_lsb) for num_lsb, tag_size in tag_sizes.items()}
+    num_probed = min(num_values, max(tag_bit_heights.values()))
+
+    with span("probe", num_probed):
+        first_rows = input_image.crop((0, 0, width, roundup(num_probed / (num_channels * width))))
+        color_values = _color_array(first_rows).reshape(-1)[:num_probed]
+        # one row per color value, holding its bits from most to least significant
+        bit_planes = np.unpackbits(color_values[:, np.newaxis], axis=1)
+
+    weights = {}
+    for num_lsb, tag_size in tag_sizes.items():
+        if tag_bit_heights[num_lsb] > num_values:
+            continue
+        tag_bits = bit_planes[:tag_bit_heights[num_lsb], 8 - num_lsb:].reshape(-1)[:8 * tag_size]
+        bytes_to_recover = int.from_bytes(np.packbits(tag_bits).tobytes(), byteorder=sys.byteorder)
+
+        maximum_bytes_in_image = max_bits_to_hide(input_image, num_lsb, num_channels) // 8 - tag_size
+        if bytes_to_recover <= maximum_bytes_in_image:
+            # likelihood ratio of a log-uniformly distributed message size against a random tag
+            weights[num_lsb] = 2 ** (8 * tag_size) / ((bytes_to_recover + 1) * math.log(maximum_bytes_in_image + 2))
+            log.debug(f"{num_lsb} LSBs would recover {bytes_to_recover} B")
+
+    if not weights:
+        raise ValueError("Unable to detect the number of LSBs, this image does not appear to hold any data")
+    num_lsb = max(weights, key=lambda n: weights[n])
+    confidence = weights[num_lsb] / sum(weights.values())
+    if confidence < DETECTION_CONFIDENCE:
+        alternatives = ", ".join(f"{n} ({weights[n] / sum(weights.values()):.0%})" for n in weights if n != num_lsb)
+        log.warning(f"Detected {num_lsb} LSBs with only {confidence:.0%} confidence, the data may instead have been "
+                    f"hidden with {alternatives} LSBs. Pass the number of LSBs explicitly if it is known")
+    else:
+        log.debug(f"Detected {num_lsb} LSBs ({confidence:.2%} confidence)")
+    return num_lsb
+
+
+def _window_sum(x: npt.NDArray[Any], row_dtype: npt.DTypeLike, dtype: npt.DTypeLike) -> npt.NDArray[Any]:
+    """Returns the sums of x over 3x3 windows of its first two axes, with the edges extended, as dtype.
+
+    Sums within rows are computed first, as row_dtype, which may be narrower than dtype."""
+    total = x
+    for axis, sum_dtype in ((1, row_dtype), (0, dtype)):
+        x, total = np.moveaxis(total, axis, 0), np.empty(total.shape, dtype=sum_dtype)
+        sums = np.moveaxis(total, axis, 0)
+        if x.shape[0] == 1:
+            np.multiply(x, 3, out=sums, dtype=sum_dtype)
+            continue
+        # the values beyond each edge repeat the edge value
+        np.add(x[:-2], x[1:-1], out=sums[1:-1], dtype=sum_dtype)
+        np.add(sums[1:-1], x[2:], out=sums[1:-1], dtype=sum_dtype)
+        np.add(x[0], x[:2].sum(axis=0, dtype=sum_dtype), out=sums[0], dtype=sum_dtype)
+        np.add(x[-1], x[-2:].sum(axis=0, dtype=sum_dtype), out=sums[-1], dtype=sum_dtype)
+    return total
+
+
+def lsb_allocation_map(color_data: npt.NDArray[np.uint8], min_lsb: int, max_lsb: int) -> npt.NDArray[np.uint8]:
+    """Returns how many LSBs adaptive hiding uses in each value of a (height, width, channels) array.
+
+    Each color value is ranked by the variance of its channel over the surrounding 3x3
+    pixels, and the values are split into equally sized groups using min_lsb, ..., max_lsb
+    LSBs, with the noisiest values using the most. The variance ignores the max_lsb LSBs,
+    which are the only bits hiding can modify, so the map is identical for the input and
+    steganographed images. This leaves no texture to measure with 8 LSBs."""
+    if not 0 <= min_lsb <= max_lsb <= 7:
+        raise ValueError(f"Adaptive hiding requires 0 <= minimum LSBs <= maximum LSBs <= 7, "
+                         f"not {min_lsb} and {max_lsb}")
+    if max_lsb == 7 and min_lsb < max_lsb:
+        log.warning("With a maximum of 7 adaptive LSBs, textures are measured from a single bit per color value")
+
+    num_levels = max_lsb - min_lsb + 1
+    if num_levels == 1 or color_data.size == 0:
+        return np.full(color_data.shape, max_lsb, dtype=np.uint8)
+
+    # The coarse values are at most 127, so sums of up to 9 of them or 3 of their squares fit in 16 bits
+    coarse = color_data >> max_lsb
+    sums = _window_sum(coarse, np.uint16, np.uint16).astype(np.int32)
+    squares = _window_sum(np.square(coarse, dtype=np.uint16), np.uint16, np.uint32).view(np.int32)
+    # 81 times the variance, which keeps everything in exact integer arithmetic
+    texture = np.multiply(squares, 9, out=squares)
+    texture -= sums * sums
+    texture = texture.reshape(-1)
+
+    # Texture values are small integers, so the quantiles come from a histogram rather than a sort
+    cumulative_counts = np.cumsum(np.bincount(texture))
+    ranks = [texture.size * level // num_levels for level in range(1, num_levels)]
+    thresholds = np.searchsorted(cumulative_counts, ranks, side="right")
+    levels = np.searchsorted(thresholds, np.arange(cumulative_counts.size), side="left").astype(np.uint8)
+    return (min_lsb + levels[texture]).astype(np.uint8).reshape(color_data.shape)
+
+
+def _color_array(image: Image.Image) -> npt.NDArray[np.uint8]:
+    color_data = np.array(image, dtype=np.uint8)
+    return color_data if color_data.ndim == 3 else color_data[:, :, np.newaxis]
+
+
+def hide_message_in_image_adaptive(input_image: Image.Image, message: Union[str, bytes], min_lsb: int, max_lsb: int,
+                                   skip_storage_check: bool = False) -> Image.Image:
+    """Hides the message in the input image using more LSBs in textured regions and returns the modified image object.
+
+    The number of LSBs used in each color value comes from lsb_allocation_map, which can be
+    recomputed from the steganographed image, so recovery only needs min_lsb and max_lsb."""
+    with span("flatten") as s:
+        color_data = _color_array(input_image)
+        s.num_bytes = color_data.size
+    with span("cost_map", color_data.size):
+        lsb_counts = lsb_allocation_map(color_data, min_lsb, max_lsb).reshape(-1)
+
+    # We add the size of the input file to the beginning of the payload.
+    max_bits = int(lsb_counts.sum(dtype=np.int64))
+    message_size = len(message)
+    file_size_tag = message_size.to_bytes(ArraySteg.bytes_in_max_file_size(max_bits, 1), byteorder=sys.byteorder)
+    data = file_size_tag + _str_to_bytes(message)
+
+    if 8 * len(data) > max_bits and not skip_storage_check:
+        raise ValueError(f"Only able to hide {max_bits // 8} bytes in this image with {min_lsb} to {max_lsb} "
+                         f"adaptive LSBs, but {len(data)} bytes were requested")
+
+    with span("interleave", len(data)):
+        lsb_interleave_variable(color_data.reshape(-1), data, lsb_counts)
+
+    with span("rebuild", color_data.size):
+        input_image.frombytes(color_data.tobytes())
+    return input_image
+
+
+def recover_message_from_image_adaptive(input_image: Image.Image, min_lsb: int, max_lsb: int) -> bytes:
+    """Returns the message from an image steganographed by hide_message_in_image_adaptive"""
+    with span("flatten") as s:
+        color_data = _color_array(input_image)
+        s.num_bytes = color_data.size
+    with span("cost_map", color_data.size):
+        lsb_counts = lsb_allocation_map(color_data, min_lsb, max_lsb).reshape(-1)
+    color_values = color_data.reshape(-1)
+
+    max_bits = int(lsb_counts.sum(dtype=np.int64))
+    file_size_tag_size = ArraySteg.bytes_in_max_file_size(max_bits, 1)
+    if 8 * file_size_tag_size > max_bits:
+        raise ValueError("This image is too small to hold any data with these adaptive LSBs")
+    bytes_to_recover = int.from_bytes(lsb_deinterleave_variable(color_values, 8 * file_size_tag_size, lsb_counts),
+                                      byteorder=sys.byteorder)
+
+    maximum_bytes_in_image = max_bits // 8 - file_size_tag_size
+    if bytes_to_recover > maximum_bytes_in_image:
+        raise ValueError(f"This image appears to be corrupted.\nIt claims to hold {bytes_to_recover} B, "
+                         f"but can only hold {maximum_bytes_in_image} B with {min_lsb} to {max_lsb} adaptive LSBs")
+
+    with span("deinterleave", bytes_to_recover):
+        data = lsb_deinterleave_variable(color_values, 8 * (bytes_to_recover + file_size_tag_size), lsb_counts)
+    return data[file_size_tag_size:]
+
+
+def recover_data(steg_image_path: str, output_file_path: str, num_lsb: Optional[int],
+                 min_lsb: Optional[int] = None) -> None:
+    """Writes the data from the steganographed image to the output file
+
+    If num_lsb is None, it is detected from the image, see detect_num_lsb.
+    If min_lsb is given, the data is recovered from an image steganographed adaptively."""
     if steg_image_path is None:
         raise ValueError("LSBSteg recovery requires an input image file path")
     if output_file_path is None:
         raise ValueError("LSBSteg recovery requires an output file path")
+    if num_lsb is None and min_lsb is not None:
+        raise ValueError("LSBSteg recovery requires the number of LSBs for adaptively steganographed images")
 
     steg_image, output_file = prepare_recover(steg_image_path, output_file_path)
     with steg_image as steg_image, output_file as output_file:
-        data = recover_message_from_image(steg_image, num_lsb)
-        start = time()
-        output_file.write(data)
-        log.debug(f"{'Output file written':<30} in {time() - start:.2f}s")
+        with span("decode") as s:
+            steg_image.load()
+            s.num_bytes = steg_image.size[0] * steg_image.size[1] * len(steg_image.getbands())
+
+        if num_lsb is None:
+            num_lsb = detect_num_lsb(steg_image)
+
+        if min_lsb is not None:
+            data = recover_message_from_image_adaptive(steg_image, min_lsb, num_lsb)
+        else:
+            data = recover_message_from_image(steg_image, num_lsb)
+
+        with span("write", len(data)):
+            output_file.write(data)
+
+
+def _strip_height(row_size: int, strip_height: Optional[int]) -> int:
+    # by default, strips hold roughly 16 MiB of pixel data
+    return strip_height if strip_height is not None else max(1, (16 << 20) // row_size)
+
+
+def hide_data_tiled(input_image_path: str, input_file_path: str, steg_image_path: str, num_lsb: int,
+                    compression_level: int, skip_storage_check: bool = False,
+                    strip_height: Optional[int] = None) -> None:
+    """Hides the data from the input file in the input PNG image, strip_height rows at a time.
+
+    This produces the same pixels as hide_data, but peak memory depends only on the strip
+    size rather than the image size. Rows after the payload are copied through without
+    being decoded."""
+    if input_image_path is None:
+        raise ValueError("LSBSteg hiding requires an input image file path")
+    if input_file_path is None:
+        raise ValueError("LSBSteg hiding requires a secret file path")
+    if steg_image_path is None:
+        raise ValueError("LSBSteg hiding requires an output image file path")
+
+    with open(input_image_path, "rb") as image_file, open(input_file_path, "rb") as input_file, \
+            open(steg_image_path, "wb") as steg_file:
+        reader = PngStripReader(image_file)
+        header = reader.header
+        writer = PngStripWriter(steg_file, header, reader.header_chunks, compression_level)
+        strip_height = _strip_height(header.row_size, strip_height)
+
+        # We add the size of the input file to the beginning of the payload.
+        num_values = header.height * header.row_size
+        file_size_tag = get_filesize(input_file_path).to_bytes(ArraySteg.bytes_in_max_file_size(num_values, num_lsb),
+                                                               byteorder=sys.byteorder)
+        data_size = len(file_size_tag) + get_filesize(input_file_path)
+        if 8 * data_size > num_values * num_lsb and not skip_storage_check:
+            raise ValueError(f"Only able to hide {num_values * num_lsb // 8} bytes in "
+                             f"this image with {num_lsb} LSBs, but {data_size} bytes were requested")
+
+        def read_data(start: int, stop: int) -> bytes:
+            """Returns bytes [start, stop) of the tagged payload without reading the whole input file."""
+            input_file.seek(max(start - len(file_size_tag), 0))
+            return file_size_tag[start:stop] + input_file.read(max(stop - max(start, len(file_size_tag)), 0))
+
+        payload_rows = min(roundup(8 * data_size / num_lsb / header.row_size), header.height)
+        previous_row = None
+        bit_offset = 0
+        for row in range(0, payload_rows, strip_height):
+            num_rows = min(strip_height, payload_rows - row)
+            with span("decode", num_rows * header.row_size):
+                pixels = decode_rows(header, reader.read_rows(num_rows), previous_row)
+                previous_row = pixels[-1].tobytes()
+
+            with span("interleave") as s:
+                start, stop = bit_offset // 8, min(roundup(bit_offset + pixels.size * num_lsb, 8) // 8, data_size)
+                bit_offset += lsb_interleave_array(pixels.reshape(-1), read_data(start, stop), num_lsb,
+                                                   bit_offset=bit_offset - 8 * start)
+                s.num_bytes = stop - start
+
+            with span("encode", pixels.size):
+                writer.write_rows(pixels)
+
+        with span("copy", (header.height - payload_rows) * header.scanline_size):
+            if payload_rows < header.height:
+                # the first untouched row may be filtered relative to the row above it, which we modified
+                writer.write_rows(decode_rows(header, reader.read_rows(1), previous_row))
+            for row in range(payload_rows + 1, header.height, strip_height):
+                writer.write_filtered_rows(reader.read_rows(min(strip_height, header.height - row)))
+            writer.finish()
+            reader.copy_trailing_chunks(steg_file)
+
+
+def recover_data_tiled(steg_image_path: str, output_file_path: str, num_lsb: int,
+                       strip_height: Optional[int] = None) -> None:
+    """Writes the data from the steganographed PNG image to the output file, strip_height rows at a time.
+
+    Only the rows holding the payload are decoded."""
+    if steg_image_path is None:
+        raise ValueError("LSBSteg recovery requires an input image file path")
+    if output_file_path is None:
+        raise ValueError("LSBSteg recovery requires an output file path")
+
+    with open(steg_image_path, "rb") as steg_file, open(output_file_path, "wb+") as output_file:
+        reader = PngStripReader(steg_file)
+        header = reader.header
+        strip_height = _strip_height(header.row_size, strip_height)
+
+        num_values = header.height * header.row_size
+        file_size_tag_size = ArraySteg.bytes_in_max_file_size(num_values, num_lsb)
+        bits_to_recover: Optional[int] = None  # including the file size tag, once known
+        num_recovered = 0
+        num_written = 0
+        pending_bits = np.zeros(0, dtype=np.uint8)
+        previous_row = None
+
+        for row in range(0, header.height, strip_height):
+            num_rows = min(strip_height, header.height - row)
+            with span("decode", num_rows * header.row_size):
+                pixels = decode_rows(header, reader.read_rows(num_rows), previous_row)
+                previous_row = pixels[-1].tobytes()
+
+            with span("deinterleave") as s:
+                remaining = pixels.size * num_lsb if bits_to_recover is None else bits_to_recover - num_recovered
+                bits = lsb_deinterleave_array(pixels.reshape(-1), remaining, num_lsb)
+                pending_bits = np.concatenate([pending_bits, bits])
+                num_recovered += bits.size
+
+                if bits_to_recover is None and num_recovered >= 8 * file_size_tag_size:
+                    bytes_to_recover = int.from_bytes(np.packbits(pending_bits[:8 * file_size_tag_size]).tobytes(),
+                                                      byteorder=sys.byteorder)
+                    maximum_bytes_in_image = num_values * num_lsb // 8 - file_size_tag_size
+                    if bytes_to_recover > maximum_bytes_in_image:
+                        raise ValueError(f"This image appears to be corrupted.\nIt claims to hold "
+                                         f"{bytes_to_recover} B, but can only hold {maximum_bytes_in_image} B with "
+                                         f"{num_lsb} LSBs")
+                    bits_to_recover = 8 * (file_size_tag_size + bytes_to_recover)
+                    pending_bits = pending_bits[8 * file_size_tag_size:]
+
+                if bits_to_recover is not None:
+                    # write every whole byte we have so far, keeping any partial byte for the next strip
+                    num_bits = min(pending_bits.size, bits_to_recover - 8 * file_size_tag_size - 8 * num_written)
+                    num_bits -= num_bits % 8
+                    output_file.write(np.packbits(pending_bits[:num_bits]).tobytes())
+                    pending_bits = pending_bits[num_bits:]
+                    num_written += num_bits // 8
+                    s.num_bytes = num_bits // 8
+
+            if bits_to_recover is not None and num_recovered >= bits_to_recover:
+                break
 
 
 def analysis(image_file_path: str, input_file_path: str, num_lsb: int) -> None:
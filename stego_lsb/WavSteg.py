@@ -12,15 +12,171 @@
 import logging
 import math
 import os
-import wave
-from time import time
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from stego_lsb.bit_manipulation import lsb_deinterleave_bytes, lsb_interleave_bytes
+from stego_lsb.bit_manipulation import BufferPool, lsb_deinterleave_into, lsb_interleave_into, roundup
+from stego_lsb.checkpoint import (
+    describe_files,
+    describe_outputs,
+    load_checkpoint,
+    outputs_resumable,
+    remove_checkpoint,
+    save_checkpoint,
+    sync,
+)
+from stego_lsb.instrumentation import span
+from stego_lsb.riff import WavInfo, read_wav_info
 
 log = logging.getLogger(__name__)
 
+# Samples are processed in blocks of this many samples. It is a multiple of 8, so every full block holds a whole
+# number of payload bytes for any number of LSBs, and memory usage doesn't depend on the size of the sound file.
+BLOCK_SAMPLES = 1 << 20
 
-def hide_data(sound_path: str, file_path: str, output_path: str, num_lsb: int) -> None:
+# In stream mode, at most this many samples are processed at a time, which bounds the latency and memory usage
+STREAM_BLOCK_SAMPLES = 1 << 14
+
+# When checkpointing, progress is saved after roughly this many bytes of sound data
+CHECKPOINT_INTERVAL = 1 << 28
+
+Checkpointer = Optional[Callable[[], None]]
+
+
+def max_bytes_to_hide(info: WavInfo, num_lsb: int) -> int:
+    """Returns the number of bytes we're able to hide in the sound file using num_lsb least significant bits."""
+    # We can hide up to num_lsb bits in each sample of the sound file
+    return (info.num_samples * num_lsb) // 8
+
+
+def _check_num_lsb(num_lsb: int, sample_width: int) -> None:
+    if not 1 <= num_lsb <= 8 * sample_width:
+        raise ValueError(f"WavSteg can use between 1 and {8 * sample_width} LSBs of {8 * sample_width}-bit samples, "
+                         f"not {num_lsb}")
+
+
+def _read_wav_infos(sound_paths: Sequence[str], num_lsb: int) -> List[WavInfo]:
+    infos = []
+    for sound_path in sound_paths:
+        with open(sound_path, "rb") as sound:
+            infos.append(read_wav_info(sound))
+        _check_num_lsb(num_lsb, infos[-1].sample_width)
+    return infos
+
+
+def _checkpointer(checkpoint_path: Optional[str], job: Dict[str, Any], output_file: IO[bytes],
+                  progress: Callable[[], Dict[str, Any]]) -> Checkpointer:
+    """Returns a function that durably saves the current progress of a job, or None if not checkpointing."""
+    if checkpoint_path is None:
+        return None
+
+    def save() -> None:
+        sync(output_file)
+        save_checkpoint(checkpoint_path, job, progress())
+    return save
+
+
+def _load_progress(checkpoint_path: Optional[str], job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the saved progress of the job, unless its output files have been replaced or modified since."""
+    progress = load_checkpoint(checkpoint_path, job) if checkpoint_path is not None else None
+    if progress is not None and not outputs_resumable(progress["outputs"]):
+        log.debug(f"Ignoring checkpoint {checkpoint_path}, its output files have been replaced or modified")
+        return None
+    return progress
+
+
+class _CheckpointTimer:
+    """Calls checkpoint after every CHECKPOINT_INTERVAL bytes of sound data."""
+
+    def __init__(self, checkpoint: Checkpointer) -> None:
+        self.checkpoint = checkpoint
+        self.num_bytes = 0
+
+    def update(self, num_bytes: int) -> None:
+        self.num_bytes += num_bytes
+        if self.checkpoint is not None and self.num_bytes >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+            self.num_bytes = 0
+
+
+def _copy_bytes(source: IO[bytes], destination: IO[bytes], num_bytes: int) -> None:
+    while num_bytes > 0:
+        data = source.read(min(num_bytes, 1 << 20))
+        if not data:
+            raise ValueError("Sound file ended unexpectedly")
+        destination.write(data)
+        num_bytes -= len(data)
+
+
+def _copy_remaining(source: IO[bytes], destination: IO[bytes], checkpoint: Checkpointer = None) -> int:
+    """Copies the rest of source to destination and returns the number of bytes copied."""
+    timer = _CheckpointTimer(checkpoint)
+    num_bytes = 0
+    while True:
+        data = source.read(1 << 20)
+        if not data:
+            return num_bytes
+        destination.write(data)
+        num_bytes += len(data)
+        timer.update(len(data))
+
+
+def _read_samples(sound: IO[bytes], samples: memoryview) -> None:
+    # note: typing does not recognize that binary files opened for reading provide readinto()
+    if sound.readinto(samples) != len(samples):  # type: ignore[attr-defined]
+        raise ValueError("Sound file ended unexpectedly")
+
+
+def _interleave_blocks(sound: IO[bytes], sound_steg: IO[bytes], payload_file: IO[bytes], num_bytes: int,
+                       num_lsb: int, sample_width: int, pool: BufferPool, checkpoint: Checkpointer = None) -> None:
+    """Hides num_bytes bytes from payload_file in the samples at the current position of sound."""
+    block = bytearray(BLOCK_SAMPLES * sample_width)
+    timer = _CheckpointTimer(checkpoint)
+    while num_bytes > 0:
+        payload = payload_file.read(min(BLOCK_SAMPLES * num_lsb // 8, num_bytes))
+        if not payload:
+            raise ValueError("Input file ended unexpectedly")
+
+        samples = memoryview(block)[:roundup(8 * len(payload) / num_lsb) * sample_width]
+        _read_samples(sound, samples)
+        lsb_interleave_into(samples, payload, num_lsb, samples, byte_depth=sample_width, pool=pool)
+        sound_steg.write(samples)
+        num_bytes -= len(payload)
+        timer.update(len(samples))
+
+
+def _deinterleave_blocks(sound: IO[bytes], output_file: IO[bytes], num_bytes: int, num_lsb: int,
+                         sample_width: int, pool: BufferPool, checkpoint: Checkpointer = None) -> None:
+    """Recovers num_bytes bytes hidden in the samples at the current position of sound."""
+    block = bytearray(BLOCK_SAMPLES * sample_width)
+    data = bytearray(BLOCK_SAMPLES * num_lsb // 8)
+    timer = _CheckpointTimer(checkpoint)
+    while num_bytes > 0:
+        block_bytes = min(len(data), num_bytes)
+        samples = memoryview(block)[:roundup(8 * block_bytes / num_lsb) * sample_width]
+        _read_samples(sound, samples)
+        lsb_deinterleave_into(samples, 8 * block_bytes, num_lsb, data, byte_depth=sample_width, pool=pool)
+        output_file.write(memoryview(data)[:block_bytes])
+        num_bytes -= block_bytes
+        timer.update(len(samples))
+
+
+def _open_steg_output(output_path: str, sound: IO[bytes], info: WavInfo, resume_offset: int) -> IO[bytes]:
+    """Opens the output for sound, positioning both where hiding starts, or resumes at resume_offset if nonzero."""
+    sound_steg: IO[bytes]
+    if not resume_offset:
+        sound_steg = open(output_path, "wb")
+        _copy_bytes(sound, sound_steg, info.data_offset)  # the header is copied unchanged
+        return sound_steg
+
+    sound_steg = open(output_path, "r+b")
+    sound.seek(resume_offset)
+    sound_steg.seek(resume_offset)
+    sound_steg.truncate()
+    return sound_steg
+
+
+def hide_data(sound_path: str, file_path: str, output_path: str, num_lsb: int,
+              checkpoint_path: Optional[str] = None) -> None:
     """Hide data from the file at file_path in the sound file at sound_path"""
     if sound_path is None:
         raise ValueError("WavSteg hiding requires an input sound file path")
@@ -29,70 +185,230 @@ def hide_data(sound_path: str, file_path: str, output_path: str, num_lsb: int) -
     if output_path is None:
         raise ValueError("WavSteg hiding requires an output sound file path")
 
-    with wave.open(sound_path, "r") as sound:
-        params = sound.getparams()
-        num_channels = sound.getnchannels()
-        sample_width = sound.getsampwidth()
-        num_frames = sound.getnframes()
-        num_samples = num_frames * num_channels
+    hide_data_multiple([sound_path], file_path, [output_path], num_lsb, checkpoint_path=checkpoint_path)
+
 
-        # We can hide up to num_lsb bits in each sample of the sound file
-        max_bytes_to_hide = (num_samples * num_lsb) // 8
-        file_size = os.stat(file_path).st_size
+def hide_data_multiple(sound_paths: Sequence[str], file_path: str, output_paths: Sequence[str], num_lsb: int,
+                       checkpoint_path: Optional[str] = None) -> None:
+    """Hide data from the file at file_path across the sound files at sound_paths, in order.
 
-        log.debug(f"Using {num_lsb} LSBs, we can hide {max_bytes_to_hide} bytes")
+    Each sound file is filled before moving on to the next, and the results are written to
+    the corresponding output_paths. Samples are streamed, so any size of RIFF or RF64 file
+    can be used with constant memory.
 
-        start = time()
-        sound_frames = sound.readframes(num_frames)
-        with open(file_path, "rb") as file:
-            data = file.read()
-        log.debug(f"{'Files read':<30} in {time() - start:.2f}s")
+    If checkpoint_path is given, progress is periodically saved there and an interrupted
+    run of the same job resumes from its last checkpoint, producing identical output."""
+    if not sound_paths:
+        raise ValueError("WavSteg hiding requires an input sound file path")
+    if file_path is None:
+        raise ValueError("WavSteg hiding requires a secret file path")
+    if len(output_paths) != len(sound_paths):
+        raise ValueError("WavSteg hiding requires an output sound file path for each input sound file")
+
+    infos = _read_wav_infos(sound_paths, num_lsb)
+    num_samples = sum(info.num_samples for info in infos)
+    total_bytes_to_hide = sum(max_bytes_to_hide(info, num_lsb) for info in infos)
+    file_size = os.stat(file_path).st_size
+
+    log.debug(f"Using {num_lsb} LSBs, we can hide {total_bytes_to_hide} bytes")
+
+    if file_size > total_bytes_to_hide:
+        required_lsb = math.ceil(file_size * 8 / num_samples)
+        raise ValueError(f"Input file too large to hide, requires {required_lsb} LSBs, using {num_lsb}")
+
+    job = {"operation": "hide", "num_lsb": num_lsb, "inputs": describe_files([*sound_paths, file_path]),
+           "outputs": [os.path.abspath(output_path) for output_path in output_paths]}
+    progress = _load_progress(checkpoint_path, job)
+    if progress is not None:
+        log.debug(f"Resuming from {checkpoint_path} at byte {progress['offset']} of {output_paths[progress['file']]}")
+    else:
+        progress = {"file": 0, "offset": 0, "payload_offset": 0}
+
+    pool = BufferPool()
+    payload_start = 0  # offset in the input file of the data hidden in the current sound file
+    with open(file_path, "rb") as payload_file:
+        for index, (sound_path, output_path, info) in enumerate(zip(sound_paths, output_paths, infos)):
+            num_bytes = min(file_size - payload_start, max_bytes_to_hide(info, num_lsb))
+            if index < progress["file"]:  # already completed
+                payload_start += num_bytes
+                continue
+
+            resume_offset = progress["offset"] if index == progress["file"] else 0
+            with open(sound_path, "rb") as sound, \
+                    _open_steg_output(output_path, sound, info, resume_offset) as sound_steg:
+                payload_file.seek(progress["payload_offset"] if resume_offset else payload_start)
+                num_hidden = payload_file.tell() - payload_start
+                checkpoint = _checkpointer(checkpoint_path, job, sound_steg, lambda: {
+                    "file": index, "offset": sound_steg.tell(), "payload_offset": payload_file.tell(),
+                    "outputs": describe_outputs(output_paths[:index + 1])})
 
-        if file_size > max_bytes_to_hide:
-            required_lsb = math.ceil(file_size * 8 / num_samples)
-            raise ValueError(f"Input file too large to hide, requires {required_lsb} LSBs, using {num_lsb}")
+                with span("interleave", num_bytes - num_hidden):
+                    _interleave_blocks(sound, sound_steg, payload_file, num_bytes - num_hidden, num_lsb,
+                                       info.sample_width, pool, checkpoint)
 
-        if sample_width < 1 or sample_width > 4:
-            # WavSteg doesn't support higher sample widths, see setsampwidth() in cpython/Libwave.py
-            raise ValueError("File has an unsupported bit-depth")
+                with span("copy") as s:
+                    # the rest of the samples and any trailing chunks are unchanged
+                    s.num_bytes = _copy_remaining(sound, sound_steg, checkpoint)
 
-        start = time()
-        sound_frames = lsb_interleave_bytes(sound_frames, data, num_lsb, byte_depth=sample_width)
-        log.debug(f"{f'{file_size} bytes hidden':<30} in {time() - start:.2f}s")
+                payload_start += num_bytes
+                if checkpoint_path is not None:
+                    sync(sound_steg)
+                    save_checkpoint(checkpoint_path, job, {"file": index + 1, "offset": 0,
+                                                           "payload_offset": payload_start,
+                                                           "outputs": describe_outputs(output_paths[:index + 1])})
 
-        start = time()
-        with wave.open(output_path, "w") as sound_steg:
-            sound_steg.setparams(params)
-            sound_steg.writeframes(sound_frames)
-        log.debug(f"{'Output wav written':<30} in {time() - start:.2f}s")
+    if checkpoint_path is not None:
+        remove_checkpoint(checkpoint_path)
 
 
-def recover_data(sound_path: str, output_path: str, num_lsb: int, bytes_to_recover: int) -> None:
+def recover_data(sound_path: str, output_path: str, num_lsb: int, bytes_to_recover: int,
+                 checkpoint_path: Optional[str] = None) -> None:
     """Recover data from the file at sound_path to the file at output_path"""
     if sound_path is None:
         raise ValueError("WavSteg recovery requires an input sound file path")
+
+    recover_data_multiple([sound_path], output_path, num_lsb, bytes_to_recover, checkpoint_path=checkpoint_path)
+
+
+def recover_data_multiple(sound_paths: Sequence[str], output_path: Optional[str], num_lsb: int,
+                          bytes_to_recover: int, checkpoint_path: Optional[str] = None) -> None:
+    """Recover data hidden by hide_data_multiple from the sound files at sound_paths to the file at output_path
+
+    If checkpoint_path is given, progress is periodically saved there and an interrupted
+    run of the same job resumes from its last checkpoint."""
+    if not sound_paths:
+        raise ValueError("WavSteg recovery requires an input sound file path")
     if output_path is None:
         raise ValueError("WavSteg recovery requires an output file path")
     if bytes_to_recover is None:
         raise ValueError("WavSteg recovery requires the number of bytes to recover")
 
-    start = time()
-    with wave.open(sound_path, "r") as sound:
-        # num_channels = sound.getnchannels()
-        sample_width = sound.getsampwidth()
-        num_frames = sound.getnframes()
-        sound_frames = sound.readframes(num_frames)
-        log.debug(f"{'Files read':<30} in {time() - start:.2f}s")
-
-        if sample_width < 1 or sample_width > 4:
-            # WavSteg doesn't support higher sample widths, see setsampwidth() in cpython/Libwave.py
-            raise ValueError("File has an unsupported bit-depth")
-
-        start = time()
-        data = lsb_deinterleave_bytes(sound_frames, 8 * bytes_to_recover, num_lsb, byte_depth=sample_width)
-        log.debug(f"{f'Recovered {bytes_to_recover} bytes':<30} in {time() - start:.2f}s")
-
-        start = time()
-        with open(output_path, "wb+") as output_file:
-            output_file.write(bytes(data))
-        log.debug(f"{'Written output file':<30} in {time() - start:.2f}s")
+    infos = _read_wav_infos(sound_paths, num_lsb)
+    total_bytes_to_recover = sum(max_bytes_to_hide(info, num_lsb) for info in infos)
+    if bytes_to_recover > total_bytes_to_recover:
+        raise ValueError(f"Unable to recover {bytes_to_recover} bytes, the sound files can only hold "
+                         f"{total_bytes_to_recover} bytes with {num_lsb} LSBs")
+
+    job = {"operation": "recover", "num_lsb": num_lsb, "bytes_to_recover": bytes_to_recover,
+           "inputs": describe_files(sound_paths), "output": os.path.abspath(output_path)}
+    progress = _load_progress(checkpoint_path, job)
+    if progress is not None:
+        log.debug(f"Resuming from {checkpoint_path} at byte {progress['output_offset']} of {output_path}")
+
+    pool = BufferPool()
+    payload_start = 0  # offset in the output file of the data hidden in the current sound file
+    with open(output_path, "r+b" if progress is not None else "wb+") as output_file:
+        if progress is not None:
+            output_file.seek(progress["output_offset"])
+            output_file.truncate()
+        else:
+            progress = {"file": 0, "offset": 0, "output_offset": 0}
+
+        for index, (sound_path, info) in enumerate(zip(sound_paths, infos)):
+            num_bytes = min(bytes_to_recover - payload_start, max_bytes_to_hide(info, num_lsb))
+            if index < progress["file"]:  # already completed
+                payload_start += num_bytes
+                continue
+
+            with open(sound_path, "rb") as sound:
+                sound.seek(progress["offset"] if index == progress["file"] and progress["offset"] else info.data_offset)
+                checkpoint = _checkpointer(checkpoint_path, job, output_file, lambda: {
+                    "file": index, "offset": sound.tell(), "output_offset": output_file.tell(),
+                    "outputs": describe_outputs([output_path])})
+                num_recovered = output_file.tell() - payload_start
+
+                with span("deinterleave", num_bytes - num_recovered):
+                    _deinterleave_blocks(sound, output_file, num_bytes - num_recovered, num_lsb, info.sample_width,
+                                         pool, checkpoint)
+            payload_start += num_bytes
+
+    if checkpoint_path is not None:
+        remove_checkpoint(checkpoint_path)
+
+
+def _stream_blocks(sound: IO[bytes], group_size: int, block_size: int) -> Iterator[bytearray]:
+    """Yields the bytes of sound as soon as they are available, in blocks of at most block_size bytes.
+
+    Blocks hold whole groups of group_size bytes, except for any trailing partial group, which is yielded last."""
+    # read1() returns whatever is available instead of waiting for a full block, which keeps the latency low
+    read = getattr(sound, "read1", sound.read)
+    pending = bytearray()
+    while True:
+        data = read(block_size - len(pending))
+        if not data:
+            if pending:
+                yield pending
+            return
+        pending += data
+        num_whole_bytes = len(pending) - len(pending) % group_size
+        if num_whole_bytes:
+            yield pending[:num_whole_bytes]
+            del pending[:num_whole_bytes]
+
+
+def _stream_block_sizes(num_lsb: int, sample_width: int, num_channels: int) -> Tuple[int, int]:
+    """Returns the group and block sizes in bytes for stream mode.
+
+    A group is the smallest whole number of frames holding a whole number of payload bytes."""
+    if sample_width < 1 or num_channels < 1:
+        raise ValueError("WavSteg stream mode requires a positive sample width and number of channels")
+    _check_num_lsb(num_lsb, sample_width)
+    # every 8 samples hold exactly num_lsb bytes, and we only write whole frames
+    group_size = 8 * num_channels // math.gcd(8, num_channels) * sample_width
+    return group_size, max(1, STREAM_BLOCK_SAMPLES * sample_width // group_size) * group_size
+
+
+def hide_data_stream(sound: IO[bytes], payload_file: IO[bytes], sound_steg: IO[bytes], num_lsb: int,
+                     sample_width: int, num_channels: int) -> None:
+    """Hide data from payload_file in the raw PCM samples read from sound, writing them to sound_steg
+
+    Samples are little-endian and sample_width bytes wide, as in .wav files. Each block is
+    written as soon as it is available, so this works on live streams (e.g. from a pipe),
+    and the samples after the hidden data are passed through unchanged."""
+    group_size, block_size = _stream_block_sizes(num_lsb, sample_width, num_channels)
+    pool = BufferPool()
+    hiding = True
+    with span("interleave") as s:
+        for block in _stream_blocks(sound, group_size, block_size):
+            if hiding:
+                capacity = len(block) // sample_width * num_lsb // 8
+                payload = payload_file.read(capacity)
+                if payload:
+                    samples = memoryview(block)[:roundup(8 * len(payload) / num_lsb) * sample_width]
+                    lsb_interleave_into(samples, payload, num_lsb, samples, byte_depth=sample_width, pool=pool)
+                    s.num_bytes += len(payload)
+                hiding = len(payload) == capacity
+            sound_steg.write(block)
+            sound_steg.flush()
+
+    if hiding and payload_file.read(1):
+        raise ValueError(f"Sound stream ended after hiding {s.num_bytes} bytes of the input file")
+
+
+def recover_data_stream(sound: IO[bytes], output_file: IO[bytes], num_lsb: int, sample_width: int,
+                        num_channels: int, bytes_to_recover: Optional[int] = None) -> None:
+    """Recover data hidden by hide_data_stream from the raw PCM samples read from sound to output_file
+
+    Each block is written as soon as it is available. If bytes_to_recover is None, data is
+    recovered from every sample until the stream ends."""
+    group_size, block_size = _stream_block_sizes(num_lsb, sample_width, num_channels)
+    pool = BufferPool()
+    data = bytearray(block_size // sample_width * num_lsb // 8)
+    num_recovered = 0
+    with span("deinterleave") as s:
+        for block in _stream_blocks(sound, group_size, block_size):
+            block_bytes = len(block) // sample_width * num_lsb // 8
+            if bytes_to_recover is not None:
+                block_bytes = min(block_bytes, bytes_to_recover - num_recovered)
+            if block_bytes > 0:
+                samples = memoryview(block)[:roundup(8 * block_bytes / num_lsb) * sample_width]
+                lsb_deinterleave_into(samples, 8 * block_bytes, num_lsb, data, byte_depth=sample_width, pool=pool)
+                output_file.write(memoryview(data)[:block_bytes])
+                output_file.flush()
+                num_recovered += block_bytes
+            if num_recovered == bytes_to_recover:
+                break
+        s.num_bytes = num_recovered
+
+    if bytes_to_recover is not None and num_recovered < bytes_to_recover:
+        raise ValueError(f"Sound stream ended after recovering {num_recovered} of {bytes_to_recover} bytes")
@@ -21,17 +21,81 @@
 # SOFTWARE.
 
 import os
-from math import ceil
+import sys
+from math import ceil, gcd
 from time import time
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
+import numpy.typing as npt
+
+# bit shifts that unpack a byte into its bits, most significant first
+_UNPACK_SHIFTS = np.arange(7, -1, -1, dtype=np.uint8)
 
 
 def roundup(x: float, base: int = 1) -> int:
     return int(ceil(x / base)) * base
 
 
+class BufferPool:
+    """Reusable scratch arrays for the *_into kernels, one per name and dtype.
+
+    Each array grows to the largest size requested and smaller requests get a view
+    into it, so a pool holds a fixed number of arrays however many payload sizes it
+    serves. The kernels size them for the whole carrier on first use, so repeated
+    calls on same-sized carriers perform no large allocations at all."""
+
+    def __init__(self) -> None:
+        self._buffers: Dict[Tuple[str, np.dtype[Any]], npt.NDArray[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def get(self, name: str, shape: Union[int, Tuple[int, ...]], dtype: npt.DTypeLike = np.uint8,
+            capacity: int = 0) -> npt.NDArray[Any]:
+        """Returns an (uninitialized) scratch array of the given shape for name.
+
+        The underlying array is only (re)allocated with room for max(size, capacity)
+        elements when it is smaller than the requested shape."""
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        size = int(np.prod(shape, dtype=np.int64))
+        key = (name, np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.size < size:
+            buffer = self._buffers[key] = np.empty(max(size, capacity), dtype=key[1])
+        return buffer[:size].reshape(shape)
+
+    def clear(self) -> None:
+        """Releases every cached scratch array."""
+        self._buffers.clear()
+
+
+def _scratch(pool: Optional[BufferPool], name: str, shape: int, capacity: int) -> npt.NDArray[np.uint8]:
+    """Returns a scratch array of shape bytes, from pool if given, sized for capacity bytes when allocated."""
+    return pool.get(name, shape, capacity=capacity) if pool is not None else np.empty(shape, dtype=np.uint8)
+
+
+def _writable_bytes(buffer: Any) -> npt.NDArray[np.uint8]:
+    out = np.frombuffer(buffer, dtype=np.uint8)
+    if not out.flags.writeable:
+        raise ValueError("Output buffer must be writable (e.g., a bytearray, numpy array, or writable mmap)")
+    return out
+
+
+def _check_num_lsb(num_lsb: int, byte_depth: int) -> None:
+    if not 1 <= num_lsb <= 8 * byte_depth:
+        raise ValueError(f"Cannot use {num_lsb} LSBs of {8 * byte_depth}-bit carrier values")
+
+
+def _lsb_positions(num_lsb: int, byte_depth: int) -> List[Tuple[int, int]]:
+    """Returns the (byte index, bit shift) of each of the num_lsb LSBs in a carrier value, most significant first."""
+    positions = []
+    for k in range(num_lsb):
+        bit_index = 8 * byte_depth - num_lsb + k
+        positions.append((bit_index // 8, 7 - bit_index % 8))
+    return positions
+
+
 def lsb_interleave_bytes(carrier: bytes, payload: bytes, num_lsb: int, truncate: bool = False,
                          byte_depth: int = 1) -> bytes:
     """
@@ -77,6 +141,270 @@ def lsb_deinterleave_bytes(carrier: bytes, num_bits: int, num_lsb: int, byte_dep
     return np.packbits(payload_bits).tobytes()[: num_bits // 8]
 
 
+def lsb_interleave_into(carrier: Any, payload: bytes, num_lsb: int, out: Any, byte_depth: int = 1,
+                        pool: Optional[BufferPool] = None) -> int:
+    """
+    Interleave the bytes of payload into the num_lsb LSBs of carrier, writing the result into out.
+
+    This produces the same bytes as lsb_interleave_bytes, but writes them into a
+    caller-supplied buffer rather than allocating new ones. out may be carrier
+    itself to modify the carrier in place.
+
+    :param carrier: carrier bytes (any object supporting the buffer protocol)
+    :param payload: payload bytes
+    :param num_lsb: number of least significant bits to use
+    :param out: writable buffer (bytearray, numpy array, mmap, ...) at least as long as carrier
+    :param byte_depth: byte depth of carrier values
+    :param pool: scratch buffer pool to reuse across calls
+    :return: The number of leading bytes of out that hold interleaved payload
+    """
+    _check_num_lsb(num_lsb, byte_depth)
+    carrier_bytes = np.frombuffer(carrier, dtype=np.uint8)
+    out_bytes = _writable_bytes(out)
+
+    plen = len(payload)
+    bit_height = roundup(plen * 8 / num_lsb)
+    if carrier_bytes.size < byte_depth * bit_height:
+        raise ValueError(f"Carrier of {carrier_bytes.size} B is too small to hide {plen} B with {num_lsb} LSBs")
+    if out_bytes.size < carrier_bytes.size:
+        raise ValueError(f"Output buffer of {out_bytes.size} B is smaller than the {carrier_bytes.size} B carrier")
+
+    if out_bytes.ctypes.data != carrier_bytes.ctypes.data:
+        out_bytes[:carrier_bytes.size] = carrier_bytes
+
+    # scratch arrays are sized for the whole carrier, so one pool serves every payload size
+    num_values = carrier_bytes.size // byte_depth
+    payload_bits = _scratch(pool, "payload_bits", bit_height * num_lsb, num_values * num_lsb)
+    np.right_shift(np.frombuffer(payload, dtype=np.uint8, count=plen)[:, None], _UNPACK_SHIFTS,
+                   out=payload_bits[:8 * plen].reshape(plen, 8))
+    np.bitwise_and(payload_bits, 1, out=payload_bits)
+    payload_bits[8 * plen:] = 0
+    payload_bits_by_value = payload_bits.reshape(bit_height, num_lsb)
+
+    carrier_values = out_bytes[:byte_depth * bit_height].reshape(bit_height, byte_depth)
+    shifted = _scratch(pool, "shifted", bit_height, num_values)
+    merged = _scratch(pool, "merged", bit_height, num_values)
+    positions = _lsb_positions(num_lsb, byte_depth)
+    for byte_index in sorted({b for b, _ in positions}):
+        # gather every payload bit destined for this byte of the carrier values, then overwrite them at once
+        merged[:] = 0
+        mask = 0
+        for k, (b, shift) in enumerate(positions):
+            if b == byte_index:
+                np.left_shift(payload_bits_by_value[:, k], shift, out=shifted)
+                np.bitwise_or(merged, shifted, out=merged)
+                mask |= 1 << shift
+        column = carrier_values[:, byte_index]
+        np.bitwise_and(column, ~mask & 0xFF, out=column)
+        np.bitwise_or(column, merged, out=column)
+
+    return byte_depth * bit_height
+
+
+def lsb_deinterleave_into(carrier: Any, num_bits: int, num_lsb: int, out: Any, byte_depth: int = 1,
+                          pool: Optional[BufferPool] = None) -> int:
+    """
+    Deinterleave num_bits bits from the num_lsb LSBs of carrier, writing the result into out.
+
+    This produces the same bytes as lsb_deinterleave_bytes, but writes them into
+    a caller-supplied buffer rather than allocating new ones.
+
+    :param carrier: carrier bytes (any object supporting the buffer protocol)
+    :param num_bits: number of num_bits to retrieve
+    :param num_lsb: number of least significant bits to use
+    :param out: writable buffer (bytearray, numpy array, mmap, ...) of at least num_bits // 8 bytes
+    :param byte_depth: byte depth of carrier values
+    :param pool: scratch buffer pool to reuse across calls
+    :return: The number of bytes written to out
+    """
+    _check_num_lsb(num_lsb, byte_depth)
+    carrier_bytes = np.frombuffer(carrier, dtype=np.uint8)
+    out_bytes = _writable_bytes(out)
+
+    plen = roundup(num_bits / num_lsb)
+    num_bytes = num_bits // 8
+    if carrier_bytes.size < byte_depth * plen:
+        raise ValueError(f"Carrier of {carrier_bytes.size} B is too small to hold {num_bits} bits with "
+                         f"{num_lsb} LSBs")
+    if out_bytes.size < num_bytes:
+        raise ValueError(f"Output buffer of {out_bytes.size} B is smaller than the {num_bytes} B requested")
+
+    num_values = carrier_bytes.size // byte_depth
+    payload_bits = _scratch(pool, "payload_bits", plen * num_lsb, num_values * num_lsb)
+    payload_bits_by_value = payload_bits.reshape(plen, num_lsb)
+    carrier_values = carrier_bytes[:byte_depth * plen].reshape(plen, byte_depth)
+    for k, (byte_index, shift) in enumerate(_lsb_positions(num_lsb, byte_depth)):
+        np.right_shift(carrier_values[:, byte_index], shift, out=payload_bits_by_value[:, k])
+    np.bitwise_and(payload_bits, 1, out=payload_bits)
+
+    payload = out_bytes[:num_bytes]
+    payload[:] = 0
+    shifted = _scratch(pool, "shifted", num_bytes, num_values * num_lsb // 8)
+    payload_bits_by_byte = payload_bits[:8 * num_bytes].reshape(num_bytes, 8)
+    for j in range(8):
+        np.left_shift(payload_bits_by_byte[:, j], 7 - j, out=shifted)
+        np.bitwise_or(payload, shifted, out=payload)
+
+    return num_bytes
+
+
+def _check_array(values: npt.NDArray[Any], num_lsb: int) -> None:
+    if values.ndim != 1 or not values.flags.c_contiguous:
+        raise ValueError("Carrier values must be a contiguous one-dimensional array")
+    if values.dtype.kind not in "ui":
+        raise ValueError(f"Carrier values must have an integer dtype, not {values.dtype}")
+    _check_num_lsb(num_lsb, values.itemsize)
+
+
+def _is_little_endian(values: npt.NDArray[Any]) -> bool:
+    byteorder = values.dtype.byteorder
+    return values.itemsize > 1 and (byteorder == "<" or (byteorder == "=" and sys.byteorder == "little"))
+
+
+def lsb_interleave_array(values: npt.NDArray[Any], payload: bytes, num_lsb: int, bit_offset: int = 0,
+                         pool: Optional[BufferPool] = None) -> int:
+    """
+    Interleave the bits of payload, starting bit_offset bits in, into the num_lsb LSBs of values in place.
+
+    Unlike the byte kernels, this works on the numeric values of the array, so the
+    LSBs of each value are modified regardless of its byte order. As many bits as
+    fit are written, which allows a payload to be spread across several arrays.
+
+    :param values: contiguous one-dimensional integer array to modify
+    :param payload: payload bytes
+    :param num_lsb: number of least significant bits to use
+    :param bit_offset: number of leading payload bits to skip
+    :param pool: scratch buffer pool to reuse across calls
+    :return: The number of payload bits written
+    """
+    _check_array(values, num_lsb)
+    num_bits = min(values.size * num_lsb, 8 * len(payload) - bit_offset)
+    if num_bits <= 0:
+        return 0
+
+    start, stop = bit_offset // 8, roundup(bit_offset + num_bits, 8) // 8
+    payload_bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8)[start:stop])[bit_offset % 8:][:num_bits]
+
+    # Groups of this many values hold a whole number of payload bytes, so everything but the (short) final group
+    # can be interleaved directly. The final group is interleaved in a zero-padded copy.
+    group_size = 8 // gcd(8, num_lsb)
+    num_values = roundup(num_bits / num_lsb)
+    num_aligned = num_values - num_values % group_size
+
+    def interleave(region: npt.NDArray[Any], bits: npt.NDArray[np.uint8]) -> None:
+        # the byte kernels expect big-endian values, see lsb_interleave_bytes
+        swap = _is_little_endian(region)
+        if swap:
+            region.byteswap(inplace=True)
+        lsb_interleave_into(region, np.packbits(bits).tobytes(), num_lsb, region, byte_depth=region.itemsize,
+                            pool=pool)
+        if swap:
+            region.byteswap(inplace=True)
+
+    if num_aligned:
+        interleave(values[:num_aligned], payload_bits[:num_aligned * num_lsb])
+    if num_values > num_aligned:
+        remainder = np.zeros(group_size, dtype=values.dtype)
+        remainder[:num_values - num_aligned] = values[num_aligned:num_values]
+        remainder_bits = np.zeros(group_size * num_lsb, dtype=np.uint8)
+        remainder_bits[:num_bits - num_aligned * num_lsb] = payload_bits[num_aligned * num_lsb:]
+        interleave(remainder, remainder_bits)
+        values[num_aligned:num_values] = remainder[:num_values - num_aligned]
+
+    return num_bits
+
+
+def lsb_deinterleave_array(values: npt.NDArray[Any], num_bits: int, num_lsb: int) -> npt.NDArray[np.uint8]:
+    """
+    Deinterleave up to num_bits bits from the num_lsb LSBs of values.
+
+    :param values: contiguous one-dimensional integer array
+    :param num_bits: number of bits to retrieve
+    :param num_lsb: number of least significant bits to use
+    :return: The deinterleaved bits (one per uint8), fewer than num_bits if values is too short
+    """
+    _check_array(values, num_lsb)
+    num_bits = max(min(values.size * num_lsb, num_bits), 0)
+    num_values = roundup(num_bits / num_lsb)
+    group_size = 8 // gcd(8, num_lsb)
+    big_endian = values.dtype.newbyteorder(">")
+
+    # pad to a whole number of groups so the byte kernel returns every requested bit
+    padded = np.zeros(roundup(num_values, group_size), dtype=big_endian)
+    padded[:num_values] = values[:num_values]
+    payload = lsb_deinterleave_bytes(padded.tobytes(), padded.size * num_lsb, num_lsb, byte_depth=values.itemsize)
+    return np.unpackbits(np.frombuffer(payload, dtype=np.uint8))[:num_bits]
+
+
+def _variable_layout(lsb_counts: npt.NDArray[Any], num_bits: int) -> Tuple[int, npt.NDArray[np.int64]]:
+    """Returns how many values are needed to hold num_bits bits and the payload bit offset of each of them."""
+    if num_bits <= 0:
+        return 0, np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lsb_counts, dtype=np.int64)
+    if ends.size == 0 or ends[-1] < num_bits:
+        raise ValueError(f"Only able to hide {int(ends[-1]) if ends.size else 0} bits in these values, "
+                         f"but {num_bits} bits were requested")
+    num_values = int(np.searchsorted(ends, num_bits)) + 1
+    return num_values, ends[:num_values] - lsb_counts[:num_values]
+
+
+def lsb_interleave_variable(values: npt.NDArray[Any], payload: bytes, lsb_counts: npt.NDArray[Any]) -> int:
+    """
+    Interleave the bytes of payload into values in place, using lsb_counts[i] LSBs of values[i].
+
+    With a constant lsb_counts, this matches lsb_interleave_bytes. Values with a count of
+    zero are skipped.
+
+    :param values: one-dimensional unsigned integer array to modify
+    :param payload: payload bytes
+    :param lsb_counts: number of least significant bits to use in each value
+    :return: The number of leading values that hold payload
+    """
+    payload_bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    num_values, starts = _variable_layout(lsb_counts, payload_bits.size)
+    if num_values == 0:
+        return 0
+
+    # pad the final value's bits with zeros, as lsb_interleave_bytes does
+    counts = lsb_counts[:num_values]
+    payload_bits = np.concatenate([payload_bits, np.zeros(int(starts[-1] + counts[-1]) - payload_bits.size,
+                                                          dtype=np.uint8)]).astype(values.dtype)
+    all_bits = (1 << (8 * values.itemsize)) - 1
+    for num_lsb in range(1, int(counts.max()) + 1):
+        indices = np.flatnonzero(counts == num_lsb)
+        if indices.size == 0:
+            continue
+        chunk = np.zeros(indices.size, dtype=values.dtype)
+        for k in range(num_lsb):
+            chunk |= payload_bits[starts[indices] + k] << (num_lsb - 1 - k)
+        mask = np.array(all_bits ^ ((1 << num_lsb) - 1), dtype=values.dtype)
+        values[indices] = (values[indices] & mask) | chunk
+
+    return num_values
+
+
+def lsb_deinterleave_variable(values: npt.NDArray[Any], num_bits: int, lsb_counts: npt.NDArray[Any]) -> bytes:
+    """
+    Deinterleave num_bits bits from values, using lsb_counts[i] LSBs of values[i].
+
+    :param values: one-dimensional unsigned integer array
+    :param num_bits: number of bits to retrieve
+    :param lsb_counts: number of least significant bits used in each value
+    :return: The deinterleaved bytes
+    """
+    num_values, starts = _variable_layout(lsb_counts, num_bits)
+    if num_values == 0:
+        return b""
+
+    counts = lsb_counts[:num_values]
+    payload_bits = np.zeros(int(starts[-1] + counts[-1]), dtype=np.uint8)
+    for num_lsb in range(1, int(counts.max()) + 1):
+        indices = np.flatnonzero(counts == num_lsb)
+        for k in range(num_lsb):
+            payload_bits[starts[indices] + k] = (values[indices] >> (num_lsb - 1 - k)) & 1
+    return np.packbits(payload_bits[:num_bits]).tobytes()[: num_bits // 8]
+
+
 def lsb_interleave_list(carrier: List[np.uint8], payload: bytes, num_lsb: int) -> List[np.uint8]:
     """Runs lsb_interleave_bytes with a List[uint8] carrier.
 
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+    stego_lsb.checkpoint
+    ~~~~~~~~~~~~~~~~~~~~
+
+    This module contains functions for durably recording the progress
+    of long-running jobs in a JSON sidecar file, so that an interrupted
+    job can resume from its last completed chunk.
+
+    :copyright: (c) 2015 by Ryan Gibson, see AUTHORS.md for more details.
+    :license: MIT License, see LICENSE.md for more details.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, IO, Optional, Sequence
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+
+# Outputs are only resumed if this many bytes before their checkpointed size are unchanged
+TAIL_DIGEST_BYTES = 1 << 16
+
+
+def describe_files(paths: Sequence[str]) -> Dict[str, Any]:
+    """Returns the sizes and modification times of paths, so checkpoints for modified files can be rejected."""
+    stats = [os.stat(path) for path in paths]
+    return {"paths": [os.path.abspath(path) for path in paths],
+            "sizes": [stat.st_size for stat in stats],
+            "mtimes": [stat.st_mtime_ns for stat in stats]}
+
+
+def _tail_digest(path: str, size: int) -> str:
+    """Returns a digest of the (up to) TAIL_DIGEST_BYTES bytes before offset size of the file at path."""
+    with open(path, "rb") as file:
+        file.seek(max(size - TAIL_DIGEST_BYTES, 0))
+        return hashlib.sha256(file.read(min(size, TAIL_DIGEST_BYTES))).hexdigest()
+
+
+def describe_outputs(paths: Sequence[str]) -> Dict[str, Any]:
+    """Returns the identities and sizes of output paths, with a digest of their last bytes.
+
+    The outputs must already be on disk, see sync()."""
+    stats = [os.stat(path) for path in paths]
+    return {"paths": [os.path.abspath(path) for path in paths],
+            "ids": [[stat.st_dev, stat.st_ino] for stat in stats],
+            "sizes": [stat.st_size for stat in stats],
+            "digests": [_tail_digest(path, stat.st_size) for path, stat in zip(paths, stats)]}
+
+
+def outputs_resumable(description: Dict[str, Any]) -> bool:
+    """Returns whether the outputs in a description from describe_outputs() still hold what they held then.
+
+    An interrupted job usually writes more output after its last checkpoint, so outputs may
+    have grown since, as resuming truncates them anyway. They must be the same files, though,
+    and their first sizes bytes must still end with the same data."""
+    try:
+        for path, file_id, size, digest in zip(description["paths"], description["ids"], description["sizes"],
+                                               description["digests"]):
+            stat = os.stat(path)
+            if [stat.st_dev, stat.st_ino] != file_id or stat.st_size < size or _tail_digest(path, size) != digest:
+                return False
+    except OSError:
+        return False
+    return True
+
+
+def load_checkpoint(checkpoint_path: str, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the progress saved at checkpoint_path, or None if there is none for this exact job."""
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        log.debug(f"Ignoring unreadable checkpoint {checkpoint_path}")
+        return None
+
+    if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("job") != job:
+        log.debug(f"Ignoring checkpoint {checkpoint_path} from a different job")
+        return None
+    return dict(checkpoint["progress"])
+
+
+def sync(file: IO[bytes]) -> None:
+    """Flushes file all the way to disk."""
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def save_checkpoint(checkpoint_path: str, job: Dict[str, Any], progress: Dict[str, Any]) -> None:
+    """Atomically replaces the checkpoint at checkpoint_path.
+
+    Any output the progress refers to must already be on disk, see sync()."""
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump({"version": CHECKPOINT_VERSION, "job": job, "progress": progress}, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, checkpoint_path)
+
+    if hasattr(os, "O_DIRECTORY"):  # also persist the rename itself, where the platform allows it
+        directory = os.open(os.path.dirname(os.path.abspath(checkpoint_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def remove_checkpoint(checkpoint_path: str) -> None:
+    """Removes the checkpoint once its job has completed."""
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
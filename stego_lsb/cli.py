@@ -16,10 +16,12 @@ TODO: should this be refactored more? I am trusting that @sh4nks implemented thi
 :license: MIT License, see LICENSE.md for more details.
 """
 import logging
+import tracemalloc
+from typing import Optional, Tuple
 
 import click
 
-from stego_lsb import LSBSteg, StegDetect, WavSteg, bit_manipulation
+from stego_lsb import LSBSteg, StegDetect, WavSteg, bit_manipulation, instrumentation
 
 # enable logging output
 logging.basicConfig(format="%(message)s", level=logging.INFO)
@@ -29,8 +31,28 @@ log.setLevel(logging.DEBUG)
 
 @click.group()
 @click.version_option()
-def main() -> None:
+@click.option("--profile", type=click.Choice(["json"]), help="Report per-stage timings and memory usage on stderr")
+@click.option("--trace-memory", is_flag=True,
+              help="Also trace allocations to report each stage's peak memory (distorts the timings), "
+                   "implies --profile json")
+@click.pass_context
+def main(ctx: click.Context, profile: Optional[str], trace_memory: bool) -> None:
     """Console script for stegolsb."""
+    if trace_memory:
+        # the traced peaks are only reported in the profile
+        profile = profile or "json"
+        tracemalloc.start()
+    if profile == "json":
+        spans = ctx.with_resource(instrumentation.collect())
+        ctx.call_on_close(lambda: click.echo(instrumentation.spans_to_json(spans), err=True))
+
+
+def _check_steglsb_modes(recover: bool, tiled: bool, min_lsb_count: Optional[int], detect_lsb_count: bool) -> None:
+    """Rejects combinations of steglsb options that would otherwise be silently ignored."""
+    if tiled and min_lsb_count is not None:
+        raise ValueError("Adaptive hiding is not supported in tiled mode")
+    if recover and detect_lsb_count and (tiled or min_lsb_count is not None):
+        raise ValueError("Detecting the number of LSBs is not supported in tiled or adaptive mode")
 
 
 @main.command(context_settings=dict(max_content_width=120))
@@ -44,18 +66,30 @@ def main() -> None:
 @click.option("--lsb-count", "-n", default=2, show_default=True, help="How many LSBs to use", type=int)
 @click.option("--compression", "-c", help="1 (best speed) to 9 (smallest file size)", default=1, show_default=True,
               type=click.IntRange(1, 9))
+@click.option("--tiled", "-t", is_flag=True, default=False, show_default=True,
+              help="Process a PNG image in strips of rows to bound memory usage")
+@click.option("--min-lsb-count", "-m", type=int,
+              help="Hide adaptively, using between this many and --lsb-count LSBs depending on local texture")
+@click.option("--detect-lsb-count", "-d", is_flag=True, default=False, show_default=True,
+              help="When recovering, detect how many LSBs were used instead of using --lsb-count")
 @click.pass_context
 def steglsb(ctx: click.Context, hide: bool, recover: bool, analyze: bool, input_fp: str, secret_fp: str, output_fp: str,
-            lsb_count: int, compression: int) -> None:
+            lsb_count: int, compression: int, tiled: bool, min_lsb_count: Optional[int],
+            detect_lsb_count: bool) -> None:
     """Hides or recovers data in and from an image"""
     try:
+        _check_steglsb_modes(recover, tiled, min_lsb_count, detect_lsb_count)
         if analyze:
             LSBSteg.analysis(input_fp, secret_fp, lsb_count)
 
-        if hide:
-            LSBSteg.hide_data(input_fp, secret_fp, output_fp, lsb_count, compression)
+        if hide and tiled:
+            LSBSteg.hide_data_tiled(input_fp, secret_fp, output_fp, lsb_count, compression)
+        elif hide:
+            LSBSteg.hide_data(input_fp, secret_fp, output_fp, lsb_count, compression, min_lsb=min_lsb_count)
+        elif recover and tiled:
+            LSBSteg.recover_data_tiled(input_fp, output_fp, lsb_count)
         elif recover:
-            LSBSteg.recover_data(input_fp, output_fp, lsb_count)
+            LSBSteg.recover_data(input_fp, output_fp, None if detect_lsb_count else lsb_count, min_lsb=min_lsb_count)
 
         if not hide and not recover and not analyze:
             click.echo(ctx.get_help())
@@ -79,25 +113,48 @@ def stegdetect(ctx: click.Context, image_path: str, lsb_count: int) -> None:
 @main.command()
 @click.option("--hide", "-h", is_flag=True, help="To hide data in a sound file")
 @click.option("--recover", "-r", is_flag=True, help="To recover data from a sound file")
-@click.option("--input", "-i", "input_fp", help="Path to a .wav file")
+@click.option("--input", "-i", "input_fps", multiple=True,
+              help="Path to a .wav file (repeat to spread the data across several files)")
 @click.option("--secret", "-s", "secret_fp", help="Path to a file to hide in the sound file")
-@click.option("--output", "-o", "output_fp", help="Path to an output file")
+@click.option("--output", "-o", "output_fps", multiple=True,
+              help="Path to an output file (when hiding, repeat once per input file)")
 @click.option("--lsb-count", "-n", default=2, show_default=True, help="How many LSBs to use", type=int)
 @click.option("--bytes", "-b", "num_bytes", help="How many bytes to recover from the sound file", type=int)
+@click.option("--resumable", is_flag=True,
+              help="Save progress next to the first output file so an interrupted run can be resumed")
+@click.option("--raw", is_flag=True,
+              help="Stream raw little-endian PCM samples from stdin (to stdout when hiding) instead of .wav files")
+@click.option("--sample-width", "-w", default=2, show_default=True, type=int,
+              help="Bytes per sample of the raw PCM stream")
+@click.option("--channels", "-c", default=2, show_default=True, type=int,
+              help="Number of channels of the raw PCM stream")
 @click.pass_context
-def wavsteg(ctx: click.Context, hide: bool, recover: bool, input_fp: str, secret_fp: str, output_fp: str,
-            lsb_count: int, num_bytes: int) -> None:
+def wavsteg(ctx: click.Context, hide: bool, recover: bool, input_fps: Tuple[str, ...], secret_fp: str,
+            output_fps: Tuple[str, ...], lsb_count: int, num_bytes: int, resumable: bool, raw: bool,
+            sample_width: int, channels: int) -> None:
     """Hides or recovers data in and from a sound file"""
+    checkpoint_fp = f"{output_fps[0]}.checkpoint" if resumable and output_fps else None
     try:
-        if hide:
-            WavSteg.hide_data(input_fp, secret_fp, output_fp, lsb_count)
+        if raw and hide:
+            if secret_fp is None:
+                raise ValueError("WavSteg hiding requires a secret file path")
+            with click.open_file("-", "rb") as sound, open(secret_fp, "rb") as secret_file, \
+                    click.open_file("-", "wb") as sound_steg:
+                WavSteg.hide_data_stream(sound, secret_file, sound_steg, lsb_count, sample_width, channels)
+        elif raw and recover:
+            with click.open_file("-", "rb") as sound, \
+                    click.open_file(output_fps[0] if output_fps else "-", "wb") as output_file:
+                WavSteg.recover_data_stream(sound, output_file, lsb_count, sample_width, channels, num_bytes)
+        elif hide:
+            WavSteg.hide_data_multiple(input_fps, secret_fp, output_fps, lsb_count, checkpoint_path=checkpoint_fp)
         elif recover:
-            WavSteg.recover_data(input_fp, output_fp, lsb_count, num_bytes)
+            WavSteg.recover_data_multiple(input_fps, output_fps[0] if output_fps else None, lsb_count, num_bytes,
+                                          checkpoint_path=checkpoint_fp)
         else:
             click.echo(ctx.get_help())
     except ValueError as e:
         log.debug(e)
-        click.echo(ctx.get_help())
+        click.echo(ctx.get_help(), err=raw)  # keep the help out of a piped stream
 
 
 @main.command()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+    stego_lsb.instrumentation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains named timing spans for the stages of hiding
+    and recovering data (decode, flatten, interleave, rebuild, encode,
+    write, ...), along with a hook API for collecting them.
+
+    :copyright: (c) 2015 by Ryan Gibson, see AUTHORS.md for more details.
+    :license: MIT License, see LICENSE.md for more details.
+"""
+import json
+import logging
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter_ns
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore[assignment]
+
+log = logging.getLogger(__name__)
+
+
+class Span(NamedTuple):
+    """A completed stage of a hide or recover operation.
+
+    peak_rss is the peak resident set size of the process in bytes when the span
+    ended, which costs nothing to measure. It is None where the platform does not
+    report it.
+
+    peak_memory is the peak number of bytes allocated above the memory in use
+    when the span started. It is None unless tracemalloc is tracing, which slows
+    down allocation-heavy stages far more than others, so timings taken while
+    tracing should not be compared across stages."""
+    name: str
+    elapsed_ns: int
+    num_bytes: int
+    peak_rss: Optional[int]
+    peak_memory: Optional[int]
+
+
+class SpanRecorder:
+    """Mutable handle yielded by span() so the byte count can be set once known."""
+
+    def __init__(self, num_bytes: int = 0) -> None:
+        self.num_bytes = num_bytes
+
+
+Hook = Callable[[Span], None]
+_hooks: List[Hook] = []
+
+# absolute tracemalloc peaks of the enclosing spans, since each span resets the global peak
+_peak_stack: List[int] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """Registers hook to be called with every completed Span."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    """Unregisters a hook previously passed to add_hook()."""
+    _hooks.remove(hook)
+
+
+def _peak_rss() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else 1024 * peak  # macOS reports bytes, everything else KiB
+
+
+@contextmanager
+def span(name: str, num_bytes: int = 0) -> Iterator[SpanRecorder]:
+    """Times the enclosed block as the stage name and reports it to the registered hooks.
+
+    Spans may be nested, in which case the peak memory of the outer span includes the inner ones."""
+    recorder = SpanRecorder(num_bytes)
+    tracing = tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak")  # reset_peak() is Python 3.9+
+    if tracing:
+        start_memory, peak = tracemalloc.get_traced_memory()
+        if _peak_stack:
+            _peak_stack[-1] = max(_peak_stack[-1], peak)
+        _peak_stack.append(start_memory)
+        tracemalloc.reset_peak()
+    start = perf_counter_ns()
+
+    try:
+        yield recorder
+    finally:
+        elapsed = perf_counter_ns() - start
+        peak_memory = None
+        if tracing:
+            peak = max(_peak_stack.pop(), tracemalloc.get_traced_memory()[1])
+            if _peak_stack:
+                _peak_stack[-1] = max(_peak_stack[-1], peak)
+            peak_memory = peak - start_memory
+
+    completed = Span(name, elapsed, recorder.num_bytes, _peak_rss(), peak_memory)
+    log.debug(f"{name:<30} in {elapsed / 1e9:.3f}s ({recorder.num_bytes} B)")
+    for hook in list(_hooks):
+        hook(completed)
+
+
+@contextmanager
+def collect() -> Iterator[List[Span]]:
+    """Collects every Span completed inside the block into the yielded list."""
+    spans: List[Span] = []
+    add_hook(spans.append)
+    try:
+        yield spans
+    finally:
+        remove_hook(spans.append)
+
+
+def spans_to_json(spans: List[Span]) -> str:
+    """Serializes spans for consumption by external metrics pipelines."""
+    return json.dumps({"spans": [s._asdict() for s in spans]})
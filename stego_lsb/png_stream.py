@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+    stego_lsb.png_stream
+    ~~~~~~~~~~~~~~~~~~~~
+
+    This module contains a streaming reader and writer for
+    non-interlaced 8-bit PNG files, which lets LSBSteg process
+    images in strips of rows without holding the whole image.
+
+    :copyright: (c) 2015 by Ryan Gibson, see AUTHORS.md for more details.
+    :license: MIT License, see LICENSE.md for more details.
+"""
+import os
+import shutil
+import struct
+import zlib
+from typing import IO, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG color type -> (PIL mode, number of channels) for the 8-bit images LSBSteg supports
+_COLOR_TYPES = {0: ("L", 1), 2: ("RGB", 3), 4: ("LA", 2), 6: ("RGBA", 4)}
+
+# filter type of the PNG "Sub" filter, which stores each byte as the difference from the same channel to its left
+_FILTER_SUB = 1
+
+_READ_SIZE = 1 << 16
+
+
+class PngHeader(NamedTuple):
+    width: int
+    height: int
+    mode: str
+    num_channels: int
+
+    @property
+    def row_size(self) -> int:
+        """Returns the number of bytes in one row of pixels."""
+        return self.width * self.num_channels
+
+    @property
+    def scanline_size(self) -> int:
+        """Returns the number of bytes in one filtered row, including its filter type byte."""
+        return 1 + self.row_size
+
+
+def _read_chunk_header(file: IO[bytes]) -> Tuple[int, bytes]:
+    header = file.read(8)
+    if len(header) < 8:
+        raise ValueError("PNG file ended unexpectedly")
+    length, chunk_type = struct.unpack(">I4s", header)
+    return length, chunk_type
+
+
+def _write_chunk(file: IO[bytes], chunk_type: bytes, data: bytes) -> None:
+    file.write(struct.pack(">I", len(data)) + chunk_type + data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+class PngStripReader:
+    """Reads the filtered rows of a PNG file a few at a time."""
+
+    def __init__(self, file: IO[bytes]) -> None:
+        if file.read(8) != PNG_SIGNATURE:
+            raise ValueError("Tiled mode requires a PNG image")
+
+        self.file = file
+        self.header_chunks = bytearray()  # every chunk before the image data, including IHDR
+        while True:
+            length, chunk_type = _read_chunk_header(file)
+            if chunk_type == b"IDAT":
+                break
+            data = file.read(length + 4)
+            if chunk_type == b"IHDR":
+                width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data[:13])
+                if bit_depth != 8 or color_type not in _COLOR_TYPES or interlace:
+                    raise ValueError("Tiled mode requires a non-interlaced, 8-bit grayscale or RGB(A) PNG image")
+                self.header = PngHeader(width, height, *_COLOR_TYPES[color_type])
+            self.header_chunks += struct.pack(">I", length) + chunk_type + data
+
+        self._idat_remaining: Optional[int] = length  # None once we have passed the last IDAT chunk
+        self._decompressor = zlib.decompressobj()
+
+    def _read_image_data(self, size: int) -> bytes:
+        """Returns up to size bytes of compressed image data, following it across IDAT chunks."""
+        while self._idat_remaining == 0:
+            self.file.read(4)  # CRC of the previous IDAT chunk
+            length, chunk_type = _read_chunk_header(self.file)
+            if chunk_type != b"IDAT":
+                self.file.seek(-8, os.SEEK_CUR)
+                self._idat_remaining = None
+            else:
+                self._idat_remaining = length
+
+        if self._idat_remaining is None:
+            return b""
+        data = self.file.read(min(size, self._idat_remaining))
+        self._idat_remaining -= len(data)
+        return data
+
+    def read_rows(self, num_rows: int) -> bytes:
+        """Returns the next num_rows filtered rows."""
+        size = num_rows * self.header.scanline_size
+        rows = bytearray()
+        while len(rows) < size:
+            compressed = self._decompressor.unconsumed_tail or self._read_image_data(_READ_SIZE)
+            if not compressed:
+                raise ValueError("PNG image data ended unexpectedly")
+            rows += self._decompressor.decompress(compressed, size - len(rows))
+        return bytes(rows)
+
+    def copy_trailing_chunks(self, output_file: IO[bytes]) -> None:
+        """Copies every chunk after the image data (including IEND) to output_file."""
+        while self._read_image_data(_READ_SIZE):
+            pass
+        shutil.copyfileobj(self.file, output_file)
+
+
+class PngStripWriter:
+    """Writes a PNG file a few rows at a time."""
+
+    def __init__(self, file: IO[bytes], header: PngHeader, header_chunks: Union[bytes, bytearray],
+                 compression_level: int) -> None:
+        self.file = file
+        self.header = header
+        self._compressor = zlib.compressobj(compression_level)
+        file.write(PNG_SIGNATURE + header_chunks)
+
+    def write_filtered_rows(self, rows: bytes) -> None:
+        """Writes rows that are already filtered, e.g. from PngStripReader.read_rows()."""
+        compressed = self._compressor.compress(rows)
+        if compressed:
+            _write_chunk(self.file, b"IDAT", compressed)
+
+    def write_rows(self, pixels: npt.NDArray[np.uint8]) -> None:
+        """Writes rows of pixels, given as a (rows, row_size) array."""
+        bpp = self.header.num_channels
+        filtered = np.empty((pixels.shape[0], self.header.scanline_size), dtype=np.uint8)
+        filtered[:, 0] = _FILTER_SUB
+        filtered[:, 1:1 + bpp] = pixels[:, :bpp]
+        np.subtract(pixels[:, bpp:], pixels[:, :-bpp], out=filtered[:, 1 + bpp:])
+        self.write_filtered_rows(filtered.tobytes())
+
+    def finish(self) -> None:
+        """Writes the remaining image data. Any trailing chunks (including IEND) must be written afterwards."""
+        _write_chunk(self.file, b"IDAT", self._compressor.flush())
+
+
+def decode_rows(header: PngHeader, rows: bytes, previous_row: Optional[bytes]) -> npt.NDArray[np.uint8]:
+    """Unfilters rows from PngStripReader.read_rows() into a writable (rows, row_size) array.
+
+    previous_row is the unfiltered row preceding them, or None for the first row of the image."""
+    num_rows = len(rows) // header.scanline_size
+
+    # PNG filters may refer to the previous row, so we decode it along with the strip as an unfiltered first row
+    scanlines = b"\x00" + (previous_row if previous_row is not None else bytes(header.row_size)) + rows
+    with Image.frombytes(header.mode, (header.width, num_rows + 1), zlib.compress(scanlines, 0), "zip",
+                         header.mode) as strip:
+        return np.array(strip, dtype=np.uint8).reshape(num_rows + 1, header.row_size)[1:]
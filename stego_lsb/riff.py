@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+    stego_lsb.riff
+    ~~~~~~~~~~~~~~
+
+    This module contains a minimal parser for the chunk headers of
+    RIFF and RF64/BW64 .wav files, which locates the sample data so
+    that WavSteg can stream it. Unlike the standard library's wave
+    module, it supports files larger than 4 GB.
+
+    :copyright: (c) 2015 by Ryan Gibson, see AUTHORS.md for more details.
+    :license: MIT License, see LICENSE.md for more details.
+"""
+import os
+import struct
+from typing import IO, NamedTuple, Optional
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# RF64 files store this in the 32-bit sizes and keep the real 64-bit sizes in the ds64 chunk
+_RF64_PLACEHOLDER_SIZE = 0xFFFFFFFF
+
+
+class WavInfo(NamedTuple):
+    num_channels: int
+    sample_width: int
+    num_frames: int
+    data_offset: int  # byte offset of the first sample in the file
+    data_size: int  # number of bytes of sample data
+
+    @property
+    def num_samples(self) -> int:
+        return self.num_frames * self.num_channels
+
+
+def read_wav_info(file: IO[bytes]) -> WavInfo:
+    """Parses the chunk headers of the .wav file, leaving file positioned at the start of the sample data."""
+    header = file.read(12)
+    if len(header) < 12 or header[:4] not in (b"RIFF", b"RF64", b"BW64") or header[8:] != b"WAVE":
+        raise ValueError("File is not a RIFF or RF64 .wav file")
+
+    ds64_data_size: Optional[int] = None
+    num_channels = sample_width = 0
+    while True:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("File has no data chunk")
+        chunk_id, size = struct.unpack("<4sI", chunk_header)
+        start = file.tell()
+
+        if chunk_id == b"ds64":
+            _, ds64_data_size = struct.unpack("<QQ", file.read(16))
+        elif chunk_id == b"fmt ":
+            format_tag, num_channels, _, _, block_align = struct.unpack("<HHIIH", file.read(14))
+            if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+                raise ValueError(f"File has an unsupported format (0x{format_tag:04x})")
+            sample_width = block_align // num_channels if num_channels else 0
+        elif chunk_id == b"data":
+            if num_channels < 1 or sample_width < 1:
+                raise ValueError("File has an unsupported bit-depth")
+            if size == _RF64_PLACEHOLDER_SIZE and ds64_data_size is not None:
+                size = ds64_data_size
+            # files written by streaming encoders may not have their sizes filled in
+            size = min(size, os.fstat(file.fileno()).st_size - start)
+            num_frames = size // (num_channels * sample_width)
+            return WavInfo(num_channels, sample_width, num_frames, start, num_frames * num_channels * sample_width)
+
+        file.seek(start + size + (size & 1))  # chunks are padded to an even length
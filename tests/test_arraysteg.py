@@ -0,0 +1,101 @@
+import os
+import unittest
+from typing import Any, Type
+
+import numpy as np
+from PIL import Image
+
+from stego_lsb.ArraySteg import (
+    bytes_in_max_file_size,
+    hide_message_in_array,
+    hide_message_in_frames,
+    recover_message_from_array,
+    recover_message_from_frames,
+)
+from stego_lsb.LSBSteg import recover_message_from_image
+
+
+class TestArraySteg(unittest.TestCase):
+    def check_random_frames(self, dtype: Type[np.unsignedinteger[Any]], num_trials: int = 128) -> None:
+        np.random.seed(0)
+        for _ in range(num_trials):
+            num_frames = np.random.randint(1, 8)
+            frame_shape = tuple(np.random.randint(1, 8, size=3))
+            num_lsb = np.random.randint(1, 8 * np.dtype(dtype).itemsize + 1)
+            axes = tuple(int(axis) for axis in np.random.permutation(3))
+
+            frames = np.random.randint(0, np.iinfo(dtype).max, size=(num_frames,) + frame_shape, dtype=dtype)
+            original = frames.copy()
+            num_values = frames.size
+            payload_len = num_values * num_lsb // 8 - bytes_in_max_file_size(num_values, num_lsb)
+            if payload_len < 0:
+                continue
+            payload = os.urandom(payload_len)
+
+            # streaming frame by frame matches hiding in the whole stack at once
+            streamed = np.stack(list(hide_message_in_frames(iter(frames), payload, num_lsb, num_frames, axes=axes)))
+            stacked = hide_message_in_array(original.copy(), payload, num_lsb, axes=(0,) + tuple(a + 1 for a in axes))
+            np.testing.assert_array_equal(streamed, stacked)
+
+            # only the num_lsb LSBs of each value were modified
+            np.testing.assert_array_equal(streamed >> num_lsb, original >> num_lsb)
+
+            self.assertEqual(recover_message_from_frames(iter(streamed), num_lsb, num_frames, axes=axes), payload)
+            self.assertEqual(recover_message_from_array(stacked, num_lsb, axes=(0,) + tuple(a + 1 for a in axes)),
+                             payload)
+
+    def test_uint8_frames(self) -> None:
+        self.check_random_frames(np.uint8)
+
+    def test_uint16_frames(self) -> None:
+        self.check_random_frames(np.uint16)
+
+    def test_in_place(self) -> None:
+        array = np.zeros((16, 16, 3), dtype=np.uint8)
+        self.assertIs(hide_message_in_array(array, b"in place", 1), array)
+        self.assertTrue(array.any())
+
+        read_only = np.zeros((16, 16, 3), dtype=np.uint8)
+        read_only.flags.writeable = False
+        self.assertEqual(recover_message_from_array(hide_message_in_array(read_only, b"copied", 1), 1), b"copied")
+        self.assertFalse(read_only.any())
+
+    def test_channel_views(self) -> None:
+        stack = np.random.randint(0, 256, size=(4, 16, 16, 3), dtype=np.uint8)
+        original = stack.copy()
+        payload = os.urandom(100)
+
+        # hiding in one channel of the stack modifies that channel in place
+        hide_message_in_array(stack[..., 2], payload, 2)
+        np.testing.assert_array_equal(stack[..., :2], original[..., :2])
+        self.assertEqual(recover_message_from_array(stack[..., 2], 2), payload)
+
+        expected = np.stack(list(hide_message_in_frames(iter(original[..., 0].copy()), payload, 3, 4)))
+        streamed = np.stack(list(hide_message_in_frames(iter(stack[..., 0]), payload, 3, 4)))
+        np.testing.assert_array_equal(streamed, expected)
+        self.assertEqual(recover_message_from_frames(iter(stack[..., 0]), 3, 4), payload)
+
+    def test_compatible_with_lsbsteg(self) -> None:
+        array = np.random.randint(0, 256, size=(24, 32, 3), dtype=np.uint8)
+        payload = os.urandom(100)
+        with Image.fromarray(hide_message_in_array(array, payload, 2)) as image:
+            self.assertEqual(recover_message_from_image(image, 2), payload)
+
+    def test_invalid_frame_streams(self) -> None:
+        frames = np.zeros((4, 16, 16, 3), dtype=np.uint8)
+        payload = os.urandom(4 * 16 * 16 * 3 // 8 - 10)
+
+        with self.assertRaises(ValueError):  # the stream is shorter than num_frames
+            list(hide_message_in_frames(iter(frames[:1]), payload, 1, 4))
+        with self.assertRaises(ValueError):  # the stream is empty
+            list(hide_message_in_frames(iter([]), payload, 1, 4))
+        with self.assertRaises(ValueError):  # the frames change shape
+            list(hide_message_in_frames(iter([frames[0], frames[1, :8]]), payload, 1, 4))
+
+    def test_maximum_storage(self) -> None:
+        with self.assertRaises(ValueError):
+            hide_message_in_array(np.zeros(16, dtype=np.uint8), os.urandom(2), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
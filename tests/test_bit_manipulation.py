@@ -2,7 +2,15 @@ import unittest
 
 import numpy as np
 
-from stego_lsb.bit_manipulation import lsb_interleave_bytes, lsb_deinterleave_bytes
+from stego_lsb.bit_manipulation import (
+    BufferPool,
+    lsb_deinterleave_bytes,
+    lsb_deinterleave_into,
+    lsb_deinterleave_variable,
+    lsb_interleave_bytes,
+    lsb_interleave_into,
+    lsb_interleave_variable,
+)
 
 
 class TestBitManipulation(unittest.TestCase):
@@ -18,8 +26,23 @@ class TestBitManipulation(unittest.TestCase):
         truncated_decode = lsb_deinterleave_bytes(truncated_encode, num_payload_bits, num_lsb, byte_depth=byte_depth)
         self.assertEqual(truncated_decode, payload)
 
+        # writing into a separate buffer and in place must match the allocating kernels
+        out = bytearray(len(carrier))
+        self.assertEqual(lsb_interleave_into(carrier, payload, num_lsb, out, byte_depth=byte_depth, pool=self.pool),
+                         len(truncated_encode))
+        self.assertEqual(bytes(out), encoded)
+
+        in_place = bytearray(carrier)
+        lsb_interleave_into(in_place, payload, num_lsb, in_place, byte_depth=byte_depth, pool=self.pool)
+        self.assertEqual(bytes(in_place), encoded)
+
+        recovered = np.zeros(len(payload), dtype=np.uint8)
+        lsb_deinterleave_into(in_place, num_payload_bits, num_lsb, recovered, byte_depth=byte_depth, pool=self.pool)
+        self.assertEqual(recovered.tobytes(), payload)
+
     def check_random_interleaving(self, byte_depth: int = 1, num_trials: int = 1024) -> None:
         np.random.seed(0)
+        self.pool = BufferPool()
         for _ in range(num_trials):
             carrier_len = np.random.randint(1, 16384)
 
@@ -57,6 +80,68 @@ class TestBitManipulation(unittest.TestCase):
     def test_interleaving_consistency_64bit(self) -> None:
         self.check_random_interleaving(byte_depth=8)
 
+    def test_variable_interleaving(self, num_trials: int = 256) -> None:
+        np.random.seed(0)
+        for _ in range(num_trials):
+            num_values = np.random.randint(1, 4096)
+            carrier = np.random.randint(0, 256, size=num_values, dtype=np.uint8)
+
+            # a constant number of LSBs matches the byte kernels
+            num_lsb = np.random.randint(1, 9)
+            payload = np.random.randint(0, 256, size=num_values * num_lsb // 8, dtype=np.uint8).tobytes()
+            values = carrier.copy()
+            lsb_interleave_variable(values, payload, np.full(num_values, num_lsb, dtype=np.uint8))
+            self.assertEqual(values.tobytes(), lsb_interleave_bytes(carrier.tobytes(), payload, num_lsb))
+
+            lsb_counts = np.random.randint(0, 9, size=num_values).astype(np.uint8)
+            payload = np.random.randint(0, 256, size=int(lsb_counts.sum()) // 8, dtype=np.uint8).tobytes()
+            values = carrier.copy()
+            lsb_interleave_variable(values, payload, lsb_counts)
+            self.assertEqual(lsb_deinterleave_variable(values, 8 * len(payload), lsb_counts), payload)
+            self.assertFalse(((values ^ carrier) >> lsb_counts).any())
+
+    def test_pool_reuses_buffers(self) -> None:
+        pool = BufferPool()
+        carrier = bytearray(np.random.randint(0, 256, size=4096, dtype=np.uint8).tobytes())
+        payload = np.random.randint(0, 256, size=1024, dtype=np.uint8).tobytes()
+
+        lsb_interleave_into(carrier, payload, 2, carrier, pool=pool)
+        first = pool.get("payload_bits", 8 * len(payload))
+        lsb_interleave_into(carrier, payload, 2, carrier, pool=pool)
+        self.assertIs(pool.get("payload_bits", 8 * len(payload)).base, first.base)
+
+    def test_pool_size_is_fixed(self) -> None:
+        pool = BufferPool()
+        carrier = bytearray(np.random.randint(0, 256, size=1 << 16, dtype=np.uint8).tobytes())
+        out, recovered = bytearray(len(carrier)), bytearray(len(carrier))
+
+        lsb_interleave_into(carrier, b"\x00", 2, out, pool=pool)
+        lsb_deinterleave_into(carrier, 8, 2, recovered, pool=pool)
+        num_buffers = len(pool)
+        payload_bits = pool.get("payload_bits", 1).base
+
+        # payloads of every size are served from the same arrays
+        for payload_len in range(1, 200):
+            payload = np.random.randint(0, 256, size=payload_len, dtype=np.uint8).tobytes()
+            lsb_interleave_into(carrier, payload, 2, out, pool=pool)
+            self.assertEqual(lsb_deinterleave_into(out, 8 * payload_len, 2, recovered, pool=pool), payload_len)
+            self.assertEqual(bytes(recovered[:payload_len]), payload)
+        self.assertEqual(len(pool), num_buffers)
+        self.assertIs(pool.get("payload_bits", 1).base, payload_bits)
+
+    def test_into_rejects_read_only_output(self) -> None:
+        with self.assertRaises(ValueError):
+            lsb_interleave_into(b"\x00" * 8, b"\xff", 1, b"\x00" * 8)
+
+    def test_into_rejects_invalid_num_lsb(self) -> None:
+        carrier = bytearray(64)
+        for num_lsb, byte_depth in [(0, 1), (9, 1), (-1, 2), (17, 2)]:
+            with self.assertRaises(ValueError):
+                lsb_interleave_into(carrier, b"\xff", num_lsb, carrier, byte_depth=byte_depth)
+            with self.assertRaises(ValueError):
+                lsb_deinterleave_into(carrier, 8, num_lsb, bytearray(1), byte_depth=byte_depth)
+            self.assertEqual(carrier, bytearray(64))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import tracemalloc
+import unittest
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from stego_lsb import instrumentation
+from stego_lsb.LSBSteg import hide_data, recover_data
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_span_reports_to_hooks(self) -> None:
+        reported: List[instrumentation.Span] = []
+        instrumentation.add_hook(reported.append)
+        try:
+            with instrumentation.span("interleave") as s:
+                s.num_bytes = 42
+        finally:
+            instrumentation.remove_hook(reported.append)
+
+        self.assertEqual(len(reported), 1)
+        self.assertEqual(reported[0].name, "interleave")
+        self.assertEqual(reported[0].num_bytes, 42)
+        self.assertGreaterEqual(reported[0].elapsed_ns, 0)
+
+    def test_nested_peak_memory(self) -> None:
+        reported: List[instrumentation.Span] = []
+        instrumentation.add_hook(reported.append)
+        tracemalloc.start()
+        try:
+            with instrumentation.span("outer"):
+                with instrumentation.span("inner"):
+                    data = bytearray(1 << 22)
+                    del data
+                with instrumentation.span("inner"):
+                    pass
+        finally:
+            tracemalloc.stop()
+            instrumentation.remove_hook(reported.append)
+
+        peaks = {s.name: s.peak_memory for s in reported}
+        # the inner spans reset the traced peak, but the outer span still sees the first one's allocation
+        self.assertLess(peaks["inner"] or 0, 1 << 20)
+        self.assertGreaterEqual(peaks["outer"] or 0, 1 << 22)
+        self.assertIsNotNone(reported[0].peak_rss)
+
+    def test_lsbsteg_stages(self) -> None:
+        image_filename, payload_filename = "instrumented.png", "instrumented.txt"
+        output_filename, recovered_filename = "instrumented_steg.png", "instrumented_recovered.txt"
+
+        with Image.fromarray(np.random.randint(0, 256, size=(32, 32, 3), dtype=np.uint8)) as image:
+            image.save(image_filename)
+        with open(payload_filename, "wb") as file:
+            file.write(os.urandom(100))
+
+        try:
+            with instrumentation.collect() as spans:
+                hide_data(image_filename, payload_filename, output_filename, 2, compression_level=1)
+                recover_data(output_filename, recovered_filename, 2)
+        finally:
+            for fn in [image_filename, payload_filename, output_filename, recovered_filename]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+        self.assertEqual([s.name for s in spans],
+                         ["decode", "read", "flatten", "interleave", "rebuild", "encode",
+                          "decode", "flatten", "deinterleave", "write"])
+        parsed = json.loads(instrumentation.spans_to_json(spans))
+        self.assertEqual(parsed["spans"][-1]["num_bytes"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,24 @@ import os
 import string
 import unittest
 from random import choice
+from unittest import mock
 
 import numpy as np
 import pytest
 from PIL import Image
 
-from stego_lsb.LSBSteg import hide_data, recover_data
+from stego_lsb import LSBSteg
+from stego_lsb.LSBSteg import (
+    detect_num_lsb,
+    hide_data,
+    hide_data_tiled,
+    hide_message_in_image,
+    hide_message_in_image_adaptive,
+    lsb_allocation_map,
+    recover_data,
+    recover_data_tiled,
+    recover_message_from_image_adaptive,
+)
 from stego_lsb.bit_manipulation import roundup
 
 
@@ -61,6 +73,130 @@ class TestLSBSteg(unittest.TestCase):
 
             self.assertEqual(input_payload_data, output_payload_data)
 
+    def check_tiled_interleaving(self, num_trials: int = 64, filename_length: int = 5, num_channels: int = 3) -> None:
+        filename = "".join(choice(string.ascii_lowercase) for _ in range(filename_length))
+        png_input_filename = f"{filename}.png"
+        payload_filename = f"{filename}.txt"
+        png_output_filename = f"{filename}_steg.png"
+        png_tiled_output_filename = f"{filename}_tiled_steg.png"
+        recovered_data_filename = f"{filename}_recovered.txt"
+
+        np.random.seed(0)
+        for _ in range(num_trials):
+            width = np.random.randint(1, 128)
+            height = np.random.randint(1, 128)
+            num_lsb = np.random.randint(1, 9)
+            strip_height = np.random.randint(1, 16)
+
+            file_size_tag_length = roundup(int(num_channels * width * height * num_lsb).bit_length() / 8)
+            max_payload_len = (num_channels * width * height * num_lsb - 8 * file_size_tag_length) // 8
+            if max_payload_len < 0:
+                continue
+
+            self.write_random_image(png_input_filename, width=width, height=height, num_channels=num_channels)
+            self.write_random_file(payload_filename, num_bytes=np.random.randint(0, max_payload_len + 1))
+
+            try:
+                hide_data_tiled(png_input_filename, payload_filename, png_tiled_output_filename, num_lsb,
+                                compression_level=1, strip_height=strip_height)
+                recover_data_tiled(png_tiled_output_filename, recovered_data_filename, num_lsb,
+                                   strip_height=strip_height)
+
+                # tiled output must match the untiled output pixel for pixel
+                hide_data(png_input_filename, payload_filename, png_output_filename, num_lsb, compression_level=1)
+                with Image.open(png_output_filename) as image, Image.open(png_tiled_output_filename) as tiled_image:
+                    np.testing.assert_array_equal(np.asarray(image), np.asarray(tiled_image))
+
+                with open(payload_filename, "rb") as input_file, open(recovered_data_filename, "rb") as output_file:
+                    input_payload_data = input_file.read()
+                    output_payload_data = output_file.read()
+            finally:
+                for fn in [png_input_filename, payload_filename, png_output_filename, png_tiled_output_filename,
+                           recovered_data_filename]:
+                    if os.path.exists(fn):
+                        os.remove(fn)
+
+            self.assertEqual(input_payload_data, output_payload_data)
+
+    def test_rgb_tiled_consistency(self) -> None:
+        self.check_tiled_interleaving(num_channels=3)
+
+    def test_rgba_tiled_consistency(self) -> None:
+        self.check_tiled_interleaving(num_channels=4)
+
+    def test_adaptive_steganography_consistency(self, num_trials: int = 64) -> None:
+        np.random.seed(0)
+        for _ in range(num_trials):
+            width = np.random.randint(1, 128)
+            height = np.random.randint(1, 128)
+            num_channels = np.random.randint(2, 5)
+            max_lsb = np.random.randint(1, 8)
+            min_lsb = np.random.randint(0, max_lsb + 1)
+
+            color_data = np.random.randint(0, 256, size=(height, width, num_channels), dtype=np.uint8)
+            color_data[:height // 2] = 128  # a smooth region for the allocation map to avoid
+            lsb_counts = lsb_allocation_map(color_data, min_lsb, max_lsb)
+            max_bits = int(lsb_counts.sum())
+            payload_len = (max_bits - 8 * roundup(max_bits.bit_length() / 8)) // 8
+            if payload_len < 0:
+                continue
+            payload = os.urandom(np.random.randint(0, payload_len + 1))
+
+            with Image.fromarray(color_data) as image:
+                hide_message_in_image_adaptive(image, payload, min_lsb, max_lsb)
+                steg_data = np.array(image)
+                # the allocation map can be recomputed from the steganographed image alone
+                np.testing.assert_array_equal(lsb_allocation_map(steg_data, min_lsb, max_lsb), lsb_counts)
+                self.assertEqual(recover_message_from_image_adaptive(image, min_lsb, max_lsb), payload)
+
+            # only the allotted LSBs were modified, and never those in the smooth region when it has fewer
+            self.assertFalse(((steg_data ^ color_data) >> lsb_counts).any())
+            if min_lsb < max_lsb and height > 3:
+                self.assertTrue((lsb_counts[1:height // 2 - 1] == min_lsb).all())
+
+        # with 8 LSBs there would be no bits left to measure the texture with
+        with self.assertRaises(ValueError):
+            lsb_allocation_map(np.zeros((4, 4, 3), dtype=np.uint8), 1, 8)
+
+    def test_detect_num_lsb(self) -> None:
+        np.random.seed(0)
+        for num_channels in (3, 4):
+            image_data = np.random.randint(0, 256, size=(300, 400, num_channels), dtype=np.uint8)
+            for num_lsb in range(1, 9):
+                # a message filling roughly a quarter of the image
+                message = np.random.bytes(300 * 400 * num_channels * num_lsb // 32)
+                with Image.fromarray(image_data) as image:
+                    steg_image = hide_message_in_image(image, message, num_lsb)
+                    self.assertEqual(detect_num_lsb(steg_image), num_lsb)
+
+        # small messages hidden with many LSBs are found too, and any remaining doubt is reported
+        num_correct = 0
+        for trial in range(60):
+            num_lsb = 6 + trial % 3
+            capacity = 300 * 400 * 3 * num_lsb // 8
+            message = np.random.bytes(int(capacity * np.random.uniform(0.01, 0.1)))
+            with Image.fromarray(image_data[:, :, :3]) as image:
+                steg_image = hide_message_in_image(image, message, num_lsb)
+                with mock.patch.object(LSBSteg.log, "warning") as warning:
+                    detected = detect_num_lsb(steg_image)
+            num_correct += detected == num_lsb
+            self.assertTrue(detected == num_lsb or warning.called)
+        self.assertGreaterEqual(num_correct, 54)
+
+        # the number of LSBs is detected when not given
+        self.write_random_image("detect.png", width=400, height=300, num_channels=3)
+        with open("detect.txt", "wb") as file:
+            file.write(np.random.bytes(10000))
+        try:
+            hide_data("detect.png", "detect.txt", "detect_steg.png", 5, 1)
+            recover_data("detect_steg.png", "detect_recovered.txt", None)
+            with open("detect.txt", "rb") as input_file, open("detect_recovered.txt", "rb") as output_file:
+                self.assertEqual(input_file.read(), output_file.read())
+        finally:
+            for fn in ["detect.png", "detect.txt", "detect_steg.png", "detect_recovered.txt"]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
     def test_rgb_steganography_consistency(self) -> None:
         self.check_random_interleaving(num_channels=3)
 
@@ -1,13 +1,77 @@
+import io
 import os
 import string
+import struct
 import unittest
 import wave
+from functools import partial
 from random import choice
-from typing import Any, Type
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from unittest import mock
 
 import numpy as np
 
-from stego_lsb.WavSteg import hide_data, recover_data
+from stego_lsb import WavSteg
+from stego_lsb.checkpoint import save_checkpoint
+from stego_lsb.WavSteg import (
+    hide_data,
+    hide_data_multiple,
+    hide_data_stream,
+    recover_data,
+    recover_data_multiple,
+    recover_data_stream,
+)
+
+
+class TrickleStream(io.BytesIO):
+    """A stream whose read1() returns small, irregular amounts of data, like a pipe."""
+
+    def read1(self, size: Optional[int] = -1) -> bytes:
+        available = np.random.randint(1, 1000)
+        return self.read(available if size is None or size < 0 else min(size, available))
+
+
+def interrupt_after(num_checkpoints: int) -> Any:
+    """Patch WavSteg so that a run is interrupted after saving the given number of checkpoints."""
+    num_saved = 0
+
+    def save(checkpoint_path: str, job: Dict[str, Any], progress: Dict[str, Any]) -> None:
+        nonlocal num_saved
+        if num_saved == num_checkpoints:
+            raise KeyboardInterrupt
+        num_saved += 1
+        save_checkpoint(checkpoint_path, job, progress)
+    return mock.patch.object(WavSteg, "save_checkpoint", save)
+
+
+class CountCalls:
+    """Patches a function of WavSteg to count its calls, optionally interrupting the run at one of them."""
+
+    def __init__(self, name: str, interrupt_at: Optional[int] = None) -> None:
+        self.num_calls = 0
+        function = getattr(WavSteg, name)
+
+        def count(*args: Any, **kwargs: Any) -> Any:
+            self.num_calls += 1
+            if self.num_calls == interrupt_at:
+                raise KeyboardInterrupt
+            return function(*args, **kwargs)
+        self.patch = mock.patch.object(WavSteg, name, count)
+
+    def __enter__(self) -> "CountCalls":
+        self.patch.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.patch.stop()
+
+
+def read_files(filenames: List[str]) -> List[bytes]:
+    contents = []
+    for filename in filenames:
+        with open(filename, "rb") as file:
+            contents.append(file.read())
+    return contents
 
 
 class TestWavSteg(unittest.TestCase):
@@ -73,6 +137,238 @@ class TestWavSteg(unittest.TestCase):
 
             self.assertEqual(input_payload_data, output_payload_data)
 
+    def write_random_rf64(self, filename: str, num_channels: int, sample_width: int, num_frames: int) -> None:
+        data = os.urandom(num_frames * num_channels * sample_width)
+        fmt = struct.pack("<HHIIHH", 1, num_channels, 44100, 44100 * num_channels * sample_width,
+                          num_channels * sample_width, 8 * sample_width)
+        ds64 = struct.pack("<QQQI", 4 + 36 + 24 + 8 + len(data), len(data), num_frames, 0)
+        with open(filename, "wb") as file:
+            # the 32-bit sizes are placeholders, the real ones are in the ds64 chunk
+            file.write(b"RF64" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE")
+            file.write(b"ds64" + struct.pack("<I", len(ds64)) + ds64)
+            file.write(b"fmt " + struct.pack("<I", len(fmt)) + fmt)
+            file.write(b"data" + struct.pack("<I", 0xFFFFFFFF) + data)
+
+    def test_rf64(self) -> None:
+        wav_filenames = ["rf64_a.wav", "rf64_b.wav"]
+        steg_filenames = ["rf64_a_steg.wav", "rf64_b_steg.wav"]
+        payload_input_filename, payload_output_filename = "rf64.txt", "rf64_recovered.txt"
+
+        np.random.seed(0)
+        for filename in wav_filenames:
+            self.write_random_rf64(filename, num_channels=2, sample_width=3, num_frames=1000)
+        # the payload is spread across both sound files, so it doesn't fit in either one alone
+        payload_len = 2 * 1000 * 2 * 3 // 8 - 10
+        self.write_random_file(payload_input_filename, num_bytes=payload_len)
+
+        try:
+            hide_data_multiple(wav_filenames, payload_input_filename, steg_filenames, 3)
+            recover_data_multiple(steg_filenames, payload_output_filename, 3, payload_len)
+
+            for filename, steg_filename in zip(wav_filenames, steg_filenames):
+                with open(filename, "rb") as file, open(steg_filename, "rb") as steg_file:
+                    original, steg = file.read(), steg_file.read()
+                # headers are copied unchanged
+                self.assertEqual(len(original), len(steg))
+                self.assertEqual(original[:80], steg[:80])
+
+            with open(payload_input_filename, "rb") as input_file, open(payload_output_filename, "rb") as output_file:
+                self.assertEqual(input_file.read(), output_file.read())
+        finally:
+            for fn in wav_filenames + steg_filenames + [payload_input_filename, payload_output_filename]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    def test_recover_too_many_bytes(self) -> None:
+        self.write_random_wav("short.wav", num_channels=1, sample_width=2, framerate=44100, num_frames=4000)
+        try:
+            with self.assertRaises(ValueError):
+                recover_data("short.wav", "short_recovered.txt", 2, 5000)
+        finally:
+            for fn in ["short.wav", "short_recovered.txt"]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    def test_too_many_lsbs(self) -> None:
+        self.write_random_wav("narrow.wav", num_channels=1, sample_width=1, framerate=44100, num_frames=4000)
+        self.write_random_file("narrow.txt", num_bytes=700)
+        try:
+            for num_lsb in [0, 9]:
+                with self.assertRaises(ValueError):
+                    hide_data("narrow.wav", "narrow.txt", "narrow_steg.wav", num_lsb)
+                with self.assertRaises(ValueError):
+                    recover_data("narrow.wav", "narrow_recovered.txt", num_lsb, 700)
+                # nothing is written before the number of LSBs is checked
+                self.assertFalse(os.path.exists("narrow_steg.wav") or os.path.exists("narrow_recovered.txt"))
+        finally:
+            for fn in ["narrow.wav", "narrow.txt", "narrow_steg.wav", "narrow_recovered.txt"]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    def resume_filenames(self) -> Dict[str, Any]:
+        return {
+            "wav": ["resume_a.wav", "resume_b.wav"],
+            "steg": ["resume_a_steg.wav", "resume_b_steg.wav"],
+            "expected": ["resume_a_expected.wav", "resume_b_expected.wav"],
+            "payload_input": "resume.txt",
+            "payload_output": "resume_recovered.txt",
+            "checkpoint": "resume.checkpoint",
+        }
+
+    def write_resume_inputs(self, filenames: Dict[str, Any]) -> int:
+        np.random.seed(0)
+        for filename in filenames["wav"]:
+            self.write_random_rf64(filename, num_channels=2, sample_width=2, num_frames=1000)
+        payload_len = 2 * 1000 * 2 * 3 // 8 - 10
+        self.write_random_file(filenames["payload_input"], num_bytes=payload_len)
+        return payload_len
+
+    def remove_resume_files(self, filenames: Dict[str, Any]) -> None:
+        for fn in filenames["wav"] + filenames["steg"] + filenames["expected"] + [
+                filenames["payload_input"], filenames["payload_output"], filenames["checkpoint"]]:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def run_resumed(self, run: Callable[[], None], kernel: str, interruption: Any) -> Tuple[int, int, bool]:
+        """Runs run until interruption raises KeyboardInterrupt, then runs it again.
+
+        Returns how many blocks each run processed with kernel, and whether the second run resumed."""
+        with interruption, CountCalls(kernel) as interrupted, self.assertRaises(KeyboardInterrupt):
+            run()
+        with CountCalls(kernel) as resumed, mock.patch.object(WavSteg.log, "debug") as debug:
+            run()
+        return interrupted.num_calls, resumed.num_calls, any("Resuming" in str(call.args[0])
+                                                             for call in debug.call_args_list)
+
+    def test_resume(self) -> None:
+        f = self.resume_filenames()
+        try:
+            payload_len = self.write_resume_inputs(f)
+            hide = partial(hide_data_multiple, f["wav"], f["payload_input"], f["steg"], 3,
+                           checkpoint_path=f["checkpoint"])
+            recover = partial(recover_data_multiple, f["steg"], f["payload_output"], 3, payload_len,
+                              checkpoint_path=f["checkpoint"])
+            # checkpoint after every block of 64 samples, and interrupt the run after each of its checkpoints
+            with mock.patch.object(WavSteg, "BLOCK_SAMPLES", 64), mock.patch.object(WavSteg, "CHECKPOINT_INTERVAL", 1):
+                with CountCalls("lsb_interleave_into") as hide_blocks, CountCalls("lsb_deinterleave_into") as blocks:
+                    hide_data_multiple(f["wav"], f["payload_input"], f["expected"], 3)
+                    recover_data_multiple(f["expected"], f["payload_output"], 3, payload_len)
+                self.assertEqual(hide_blocks.num_calls, blocks.num_calls)
+
+                for num_checkpoints in range(0, 50, 7):
+                    for run, kernel in [(hide, "lsb_interleave_into"), (recover, "lsb_deinterleave_into")]:
+                        num_interrupted, num_resumed, resumed = self.run_resumed(run, kernel,
+                                                                                 interrupt_after(num_checkpoints))
+                        # at most the block after the last checkpoint is processed twice
+                        self.assertEqual(resumed, num_checkpoints > 0)
+                        self.assertLessEqual(num_interrupted + num_resumed, blocks.num_calls + 1)
+                        self.assertFalse(os.path.exists(f["checkpoint"]))
+                    self.assertEqual(read_files(f["expected"]), read_files(f["steg"]))
+                    self.assertEqual(read_files([f["payload_input"]]), read_files([f["payload_output"]]))
+        finally:
+            self.remove_resume_files(f)
+
+    def test_resume_between_checkpoints(self) -> None:
+        f = self.resume_filenames()
+        try:
+            payload_len = self.write_resume_inputs(f)
+            hide = partial(hide_data_multiple, f["wav"], f["payload_input"], f["steg"], 3,
+                           checkpoint_path=f["checkpoint"])
+            recover = partial(recover_data_multiple, f["steg"], f["payload_output"], 3, payload_len,
+                              checkpoint_path=f["checkpoint"])
+            # checkpoint after every 5 blocks of 64 samples, and interrupt the run while it is processing a block
+            with mock.patch.object(WavSteg, "BLOCK_SAMPLES", 64), \
+                    mock.patch.object(WavSteg, "CHECKPOINT_INTERVAL", 5 * 64 * 2):
+                with CountCalls("lsb_interleave_into") as blocks:
+                    hide_data_multiple(f["wav"], f["payload_input"], f["expected"], 3)
+
+                # the first sound file holds 32 blocks, and its checkpoints restart at the second one
+                for interrupt_at, num_checkpointed in [(8, 5), (40, 32 + 5)]:
+                    for run, kernel in [(hide, "lsb_interleave_into"), (recover, "lsb_deinterleave_into")]:
+                        _, num_resumed, resumed = self.run_resumed(run, kernel, CountCalls(kernel, interrupt_at))
+                        self.assertTrue(resumed)
+                        self.assertEqual(num_resumed, blocks.num_calls - num_checkpointed)
+                    self.assertEqual(read_files(f["expected"]), read_files(f["steg"]))
+                    self.assertEqual(read_files([f["payload_input"]]), read_files([f["payload_output"]]))
+        finally:
+            self.remove_resume_files(f)
+
+    def test_resume_changed_outputs(self) -> None:
+        def replace_output(filename: str) -> None:
+            self.write_random_file(filename, num_bytes=4096)
+
+        def truncate_output(filename: str) -> None:
+            os.truncate(filename, 100)
+
+        f = self.resume_filenames()
+        change_outputs: List[Callable[[str], None]] = [os.remove, replace_output, truncate_output]
+        try:
+            payload_len = self.write_resume_inputs(f)
+            hide = partial(hide_data_multiple, f["wav"], f["payload_input"], f["steg"], 3,
+                           checkpoint_path=f["checkpoint"])
+            recover = partial(recover_data_multiple, f["steg"], f["payload_output"], 3, payload_len,
+                              checkpoint_path=f["checkpoint"])
+            # checkpoints are ignored once their output files are deleted, replaced or truncated
+            with mock.patch.object(WavSteg, "BLOCK_SAMPLES", 64), mock.patch.object(WavSteg, "CHECKPOINT_INTERVAL", 1):
+                with CountCalls("lsb_interleave_into") as blocks:
+                    hide_data_multiple(f["wav"], f["payload_input"], f["expected"], 3)
+
+                for change_output in change_outputs:
+                    for run, kernel, output in [(hide, "lsb_interleave_into", f["steg"][0]),
+                                                (recover, "lsb_deinterleave_into", f["payload_output"])]:
+                        with interrupt_after(10), self.assertRaises(KeyboardInterrupt):
+                            run()
+                        change_output(output)
+                        with CountCalls(kernel) as rerun:
+                            run()
+                        self.assertEqual(rerun.num_calls, blocks.num_calls)
+                    self.assertEqual(read_files(f["expected"]), read_files(f["steg"]))
+                    self.assertEqual(read_files([f["payload_input"]]), read_files([f["payload_output"]]))
+        finally:
+            self.remove_resume_files(f)
+
+    def test_stream(self) -> None:
+        wav_input_filename, wav_output_filename = "stream.wav", "stream_steg.wav"
+        payload_input_filename = "stream.txt"
+
+        np.random.seed(0)
+        for sample_width, num_channels, num_lsb in [(1, 1, 3), (2, 2, 2), (3, 6, 5), (4, 3, 8)]:
+            self.write_random_wav(wav_input_filename, num_channels=num_channels, sample_width=sample_width,
+                                  framerate=44100, num_frames=10000)
+            payload_len = 10000 * num_channels * num_lsb // 8 // 3
+            self.write_random_file(payload_input_filename, num_bytes=payload_len)
+
+            try:
+                hide_data(wav_input_filename, payload_input_filename, wav_output_filename, num_lsb)
+                with open(wav_input_filename, "rb") as file, open(wav_output_filename, "rb") as steg_file:
+                    samples, steg_samples = file.read()[44:], steg_file.read()[44:]
+                with open(payload_input_filename, "rb") as payload_file:
+                    payload = payload_file.read()
+            finally:
+                for fn in [wav_input_filename, wav_output_filename, payload_input_filename]:
+                    if os.path.exists(fn):
+                        os.remove(fn)
+
+            # raw samples arriving in small pieces are changed exactly as in a .wav file
+            output = io.BytesIO()
+            hide_data_stream(TrickleStream(samples), io.BytesIO(payload), output, num_lsb, sample_width, num_channels)
+            self.assertEqual(output.getvalue(), steg_samples)
+
+            recovered = io.BytesIO()
+            recover_data_stream(TrickleStream(steg_samples), recovered, num_lsb, sample_width, num_channels,
+                                payload_len)
+            self.assertEqual(recovered.getvalue(), payload)
+
+            # without a size, everything is recovered until the stream ends
+            recovered = io.BytesIO()
+            recover_data_stream(TrickleStream(steg_samples), recovered, num_lsb, sample_width, num_channels)
+            self.assertEqual(len(recovered.getvalue()), len(steg_samples) // sample_width * num_lsb // 8)
+            self.assertEqual(recovered.getvalue()[:payload_len], payload)
+
+            with self.assertRaises(ValueError):
+                hide_data_stream(io.BytesIO(samples[:1000]), io.BytesIO(payload), io.BytesIO(), num_lsb,
+                                 sample_width, num_channels)
+
     def test_consistency_8bit(self) -> None:
         self.check_random_interleaving(byte_depth=1)
 